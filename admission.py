@@ -0,0 +1,167 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from starlette.responses import JSONResponse
+
+import metrics
+
+# =========================
+# ADMISSION CONTROL
+# =========================
+# Every request is put in a class and must take one of that class's slots
+# before it reaches the app. When all slots are taken it waits in a bounded
+# FIFO queue for up to `max_wait` seconds. If the queue is full or the wait
+# runs out, it's shed at once with 503 + Retry-After. A login storm or a burst
+# of uploads then saturates its own class instead of the shared threadpool,
+# and cheap reads keep their latency.
+#
+# The limits of the non-read classes add up to well under the threadpool size
+# (40 by default), so reads always have threads left.
+#
+# Override with ADMISSION_LIMITS="auth=2:8:3,read=48:400:2" (limit:queue:max_wait).
+
+DEFAULT_LIMITS = {
+    # class: (concurrent, queue, max_wait_seconds)
+    "read":   (32, 256, 2.0),   # public GETs, mostly cached or one small query
+    "write":  (8, 64, 2.0),     # likes, comments, forum, chatbot, admin content edits
+    "auth":   (4, 16, 3.0),     # bcrypt: logins, registration, password changes
+    "upload": (2, 4, 5.0),      # image uploads (8 MB bodies, Storage round trip)
+    "admin":  (4, 8, 5.0),      # dashboards and moderation aggregates
+}
+
+# Never shed: long-lived streams and the endpoint you'd use to diagnose shedding.
+EXEMPT_PATHS = {"/events", "/metrics"}
+
+_AUTH_PATHS = {"/admin/login", "/users/login", "/users/register", "/users/change-password"}
+
+ADMISSION_ACTIVE = metrics.Gauge(
+    "quoteme_admission_active", "Requests holding a slot, per class.", ("class",))
+ADMISSION_QUEUED = metrics.Gauge(
+    "quoteme_admission_queued", "Requests waiting for a slot, per class.", ("class",))
+ADMISSION_WAIT_SECONDS = metrics.Histogram(
+    "quoteme_admission_wait_seconds", "Time spent queued before admission.", ("class",))
+ADMISSION_SHED = metrics.Counter(
+    "quoteme_admission_shed_total", "Requests rejected with 503, by class and reason.", ("class", "reason"))
+
+
+def classify(method: str, path: str) -> str | None:
+    """Admission class for a request, or None to bypass admission control."""
+    if path in EXEMPT_PATHS:
+        return None
+    if path in _AUTH_PATHS or path.endswith("/reset-password"):
+        return "auth"
+    if path.startswith("/upload-image"):
+        return "upload"
+    if path.startswith("/admin/"):
+        return "admin"
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return "read"
+    return "write"
+
+
+def _parse_limits(spec: str) -> dict:
+    limits = dict(DEFAULT_LIMITS)
+    for part in spec.split(","):
+        name, _, values = part.partition("=")
+        name = name.strip()
+        if name in limits and values:
+            limit, queue, wait = (values.split(":") + ["", ""])[:3]
+            default = limits[name]
+            limits[name] = (int(limit or default[0]), int(queue or default[1]), float(wait or default[2]))
+    return limits
+
+
+class _Class:
+    """Counting semaphore with a bounded, time-limited FIFO queue. Event-loop only."""
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiters: deque = deque()
+
+    async def acquire(self) -> str | None:
+        """None once a slot is held, otherwise the reason the request is shed."""
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            ADMISSION_ACTIVE.inc(self.name)
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        ADMISSION_QUEUED.inc(self.name)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+            return None   # release() handed us its slot
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                self.release()   # slot arrived just as we gave up — pass it on
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return "timeout"
+        finally:
+            ADMISSION_QUEUED.dec(self.name)
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, self.name)
+            try:
+                self.waiters.remove(future)
+            except ValueError:
+                pass
+
+    def release(self):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)   # hand the slot over; `active` is unchanged
+                return
+        self.active -= 1
+        ADMISSION_ACTIVE.dec(self.name)
+
+    def snapshot(self) -> dict:
+        return {"limit": self.limit, "queue": self.queue_size, "max_wait": self.max_wait,
+                "active": self.active, "queued": len(self.waiters)}
+
+
+_classes = {name: _Class(name, *cfg) for name, cfg in _parse_limits(os.getenv("ADMISSION_LIMITS", "")).items()}
+
+
+def status() -> dict:
+    return {name: c.snapshot() for name, c in _classes.items()}
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the per-class limits above."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = classify(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        cls = _classes[name]
+        reason = await cls.acquire()
+        if reason is not None:
+            ADMISSION_SHED.inc(name, reason)
+            response = JSONResponse(
+                {"detail": "The server is busy right now — please try again in a moment."},
+                status_code=503,
+                headers={"Retry-After": str(max(int(cls.max_wait), 1)), "X-Shed-Class": name},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            cls.release()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark: JSON serialize + compress time vs. bytes saved.
+
+Builds payloads shaped like the real list endpoints (/quotes, /stories,
+/admin/comments) at several sizes and reports, per encoder:
+    raw bytes, encoded bytes, % saved, serialize µs, compress µs
+
+Used to choose GZIP_MIN_BYTES / BROTLI_MIN_BYTES in responses.py.
+
+    python benchmarks/bench_compression.py
+"""
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from responses import dumps, brotli, orjson  # noqa: E402
+
+WORDS = ("inspire believe women youth Zimbabwe journey strength courage dream "
+         "business community resilience hope growth mentor leader family faith "
+         "school market Harare Bulawayo story success challenge future").split()
+
+
+def _sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def _paragraphs(rng, n):
+    return "\n\n".join(" ".join(_sentence(rng, rng.randint(8, 18)) for _ in range(5)) for _ in range(n))
+
+
+def make_quotes(rng, n):
+    return [{"id": i, "text": _sentence(rng, rng.randint(8, 25)), "author": "QuoteMe ZW",
+             "image_url": f"https://example.supabase.co/storage/v1/object/public/images/{i:032x}.jpg",
+             "likes": rng.randint(0, 500)} for i in range(n)]
+
+
+def make_stories(rng, n):
+    return [{"id": i, "title": _sentence(rng, 6), "content": _paragraphs(rng, rng.randint(3, 8)),
+             "image_url": None, "likes": rng.randint(0, 500),
+             "created_at": "2026-03-01T10:00:00.000000+00:00"} for i in range(n)]
+
+
+def make_comments(rng, n):
+    return [{"id": i, "content": _sentence(rng, rng.randint(4, 40)), "username": f"user_{i % 97}",
+             "user_id": i % 97, "item_type": rng.choice(["quote", "story", "blog"]),
+             "item_id": rng.randint(1, 200), "sentiment": rng.choice(["positive", "neutral", "negative"]),
+             "toxicity": 0.0, "is_hidden": False,
+             "created_at": "2026-03-01T10:00:00.000000+00:00"} for i in range(n)]
+
+
+def _time_us(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e6
+
+
+def bench(name, payload, repeat=30):
+    std = lambda: json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    raw = dumps(payload)
+    ser_std = _time_us(std, repeat)
+    ser_fast = _time_us(lambda: dumps(payload), repeat)
+    print(f"\n{name}: {len(raw):,} bytes  | json {ser_std:,.0f}µs  "
+          f"{'orjson' if orjson else 'json'} {ser_fast:,.0f}µs")
+
+    encoders = [(f"gzip-{lvl}", lambda b, l=lvl: gzip.compress(b, compresslevel=l, mtime=0)) for lvl in (1, 5, 9)]
+    if brotli is not None:
+        encoders += [(f"br-{q}", lambda b, q=q: brotli.compress(b, quality=q)) for q in (1, 4, 5, 6)]
+    for label, enc in encoders:
+        out = enc(raw)
+        us = _time_us(lambda: enc(raw), repeat)
+        saved = 100 * (1 - len(out) / len(raw))
+        print(f"  {label:8} {len(out):>9,} bytes  saved {saved:5.1f}%  {us:>9,.0f}µs")
+
+
+def main():
+    rng = random.Random(42)
+    for n in (1, 3, 10):
+        bench(f"quotes x{n}", make_quotes(rng, n))
+    for n in (1, 2, 15):
+        bench(f"stories x{n}", make_stories(rng, n))
+    for n in (50, 500):
+        bench(f"quotes x{n}", make_quotes(rng, n))
+        bench(f"admin comments x{n}", make_comments(rng, n))
+
+
+if __name__ == "__main__":
+    main()
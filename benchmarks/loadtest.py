@@ -0,0 +1,307 @@
+"""
+Load test for the hot endpoints, run in-process against a local stand-in.
+
+The app is started with STORAGE_BACKEND=sqlite on a throwaway database that is
+seeded with configurable volumes, then driven through ASGI by concurrent
+clients. Nothing touches Supabase or the network.
+
+    python benchmarks/loadtest.py                       # default volumes
+    python benchmarks/loadtest.py --quotes 2000 --comments 50000 --concurrency 64
+    python benchmarks/loadtest.py --save-baseline       # write benchmarks/baselines/<name>.json
+    python benchmarks/loadtest.py --compare             # fail (exit 1) on regressions
+
+Reports p50/p95/p99 latency, throughput and errors per scenario, plus peak
+Python memory (tracemalloc) and process max RSS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+WORDS = ("inspire believe women youth Zimbabwe journey strength courage dream "
+         "business community resilience hope growth mentor leader family faith "
+         "love great amazing sad bad school market story success future").split()
+
+
+def _text(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+# =========================
+# SETUP
+# =========================
+def load_app(db_path: str):
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["SNAPSHOT_PATH"] = os.path.join(os.path.dirname(db_path), "snapshot.json.gz")
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import logging
+    import main
+    logging.disable(logging.INFO)   # keep per-request log lines out of the numbers
+    return main
+
+
+def seed(main, args, rng):
+    """Bulk-insert content straight through the repository (no HTTP, no rate limits)."""
+    db = main.db
+    t0 = time.perf_counter()
+    pw_hash = main.pwd_context.hash("benchpass")   # one bcrypt hash, shared by every user
+
+    db.table("admins").insert({"username": "bench", "password_hash": pw_hash}).execute()
+    db.table("admin_settings").insert({"admin_id": 1, "site_title": "QuoteMe ZW"}).execute()
+    db.table("quotes").insert([
+        {"text": _text(rng, rng.randint(8, 25)), "author": "QuoteMe ZW", "likes": rng.randint(0, 300)}
+        for _ in range(args.quotes)]).execute()
+    for table, count in (("stories", args.stories), ("blogs", args.blogs)):
+        rows = []
+        for _ in range(count):
+            content = "\n\n".join(_text(rng, rng.randint(60, 120)) for _ in range(rng.randint(3, 8)))
+            rows.append({"title": _text(rng, 6), "content": content,
+                         "excerpt": main._excerpt(content), "likes": rng.randint(0, 300)})
+        db.table(table).insert(rows).execute()
+    db.table("site_users").insert([
+        {"username": f"user{i}", "email": f"user{i}@bench.test", "password_hash": pw_hash, "is_banned": 0}
+        for i in range(args.users)]).execute()
+    comments = []
+    for i in range(args.comments):
+        text = _text(rng, rng.randint(4, 40))
+        item_type = rng.choice(("quote", "story", "blog"))
+        limit = {"quote": args.quotes, "story": args.stories, "blog": args.blogs}[item_type]
+        comments.append({"content": text, "username": f"user{i % args.users}", "user_id": i % args.users + 1,
+                         "item_type": item_type, "item_id": rng.randint(1, limit),
+                         "sentiment": main._sentiment(text), "toxicity": main._toxicity(text), "is_hidden": 0})
+    for start in range(0, len(comments), 1000):
+        db.table("comments").insert(comments[start:start + 1000]).execute()
+    db.table("forumpost").insert([
+        {"name": f"user{i % args.users}", "message": _text(rng, rng.randint(5, 40))}
+        for i in range(args.posts)]).execute()
+    return time.perf_counter() - t0
+
+
+# =========================
+# SCENARIOS
+# =========================
+# Each scenario is an async callable (client, rng, ctx) -> response.
+# Every request carries a random X-Forwarded-For so the per-IP rate limiter
+# measures work, not rejections.
+def _ip(rng):
+    return {"X-Forwarded-For": f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"}
+
+
+async def homepage(client, rng, ctx):
+    return await client.get("/bootstrap", headers=_ip(rng))
+
+
+async def homepage_legacy(client, rng, ctx):
+    """The five calls index.html made before /bootstrap existed."""
+    headers = _ip(rng)
+    responses = await asyncio.gather(
+        client.get("/settings", headers=headers),
+        client.get("/quotes", headers=headers),
+        client.get("/stories?limit=25&offset=0", headers=headers),
+        client.get("/blogs?limit=6&offset=0", headers=headers),
+        client.get("/forum/posts", headers=headers),
+    )
+    return max(responses, key=lambda r: r.status_code)
+
+
+async def story_page(client, rng, ctx):
+    return await client.get(f"/story/{rng.randint(1, ctx['stories'])}", headers=_ip(rng))
+
+
+async def like(client, rng, ctx):
+    return await client.post(f"/like/quote/{rng.randint(1, ctx['quotes'])}", headers=_ip(rng))
+
+
+async def comment(client, rng, ctx):
+    return await client.post("/comments", headers={**_ip(rng), "Authorization": f"Bearer {ctx['user_token']}"},
+                             json={"content": _text(rng, 12), "item_type": "story",
+                                   "item_id": rng.randint(1, ctx["stories"])})
+
+
+async def login(client, rng, ctx):
+    i = rng.randint(0, ctx["users"] - 1)
+    return await client.post("/users/login", headers=_ip(rng),
+                             json={"email": f"user{i}@bench.test", "password": "benchpass"})
+
+
+async def chatbot(client, rng, ctx):
+    msg = rng.choice(["quote", "stories", "blogs", "help", "random quote", "about", "what is this?"])
+    return await client.post("/chatbot", headers=_ip(rng), json={"message": msg})
+
+
+async def admin_stats(client, rng, ctx):
+    path = rng.choice(["/admin/stats", "/admin/comments/stats", "/admin/users/stats"])
+    return await client.get(path, headers={"Authorization": f"Bearer {ctx['admin_token']}"})
+
+
+SCENARIOS = {
+    "homepage": homepage,
+    "homepage_legacy": homepage_legacy,
+    "story_page": story_page,
+    "like": like,
+    "comment": comment,
+    "login": login,
+    "chatbot": chatbot,
+    "admin_stats": admin_stats,
+}
+
+
+# =========================
+# DRIVER
+# =========================
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+async def run_scenario(client, name, fn, ctx, requests, concurrency, seed_value):
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker(worker_id):
+        nonlocal errors
+        rng = random.Random(seed_value * 1000 + worker_id)
+        for _ in remaining:
+            t0 = time.perf_counter()
+            try:
+                res = await fn(client, rng, ctx)
+                if res.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+async def drive(main, args):
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"Accept-Encoding": "gzip, br"}, timeout=60) as client:
+        admin = await client.post("/admin/login", json={"username": "bench", "password": "benchpass"})
+        user = await client.post("/users/login", json={"email": "user0@bench.test", "password": "benchpass"},
+                                 headers={"X-Forwarded-For": "10.255.255.1"})
+        ctx = {
+            "admin_token": admin.json()["token"],
+            "user_token": user.json()["token"],
+            "quotes": args.quotes, "stories": args.stories, "users": args.users,
+        }
+        selected = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+        results = {}
+        for i, name in enumerate(selected):
+            # bcrypt-bound scenarios get fewer requests so a run stays short
+            n = max(args.requests // 10, 20) if name == "login" else args.requests
+            results[name] = await run_scenario(client, name, SCENARIOS[name], ctx, n, args.concurrency, i)
+            r = results[name]
+            print(f"{name:16} {r['requests']:>6} req  {r['throughput_rps']:>8} rps  "
+                  f"p50 {r['p50_ms']:>8} ms  p95 {r['p95_ms']:>8} ms  p99 {r['p99_ms']:>8} ms  "
+                  f"errors {r['errors']}")
+        return results
+
+
+# =========================
+# BASELINES
+# =========================
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions against `baseline`."""
+    regressions = []
+    for name, cur in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if base[metric] and cur[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {base[metric]} → {cur[metric]}")
+        if base["throughput_rps"] and cur["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name} throughput: {base['throughput_rps']} → {cur['throughput_rps']} rps")
+        if cur["errors"] > base["errors"]:
+            regressions.append(f"{name} errors: {base['errors']} → {cur['errors']}")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quotes", type=int, default=500)
+    parser.add_argument("--stories", type=int, default=200)
+    parser.add_argument("--blogs", type=int, default=100)
+    parser.add_argument("--comments", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--scenarios", help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--name", default="default", help="baseline name")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="exit 1 if worse than the saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="quoteme-bench-")
+    main = load_app(os.path.join(tmp, "bench.db"))
+    tracemalloc.start()
+    seconds = seed(main, args, random.Random(7))
+    print(f"seeded {args.quotes} quotes, {args.stories} stories, {args.blogs} blogs, "
+          f"{args.comments} comments, {args.users} users, {args.posts} posts in {seconds:.1f}s\n")
+
+    results = asyncio.run(drive(main, args))
+
+    _, peak = tracemalloc.get_traced_memory()
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    memory = {"tracemalloc_peak_mb": round(peak / 2**20, 1), "max_rss_mb": round(rss_kb / 1024, 1)}
+    print(f"\nmemory: peak traced {memory['tracemalloc_peak_mb']} MB, max RSS {memory['max_rss_mb']} MB")
+
+    report = {
+        "volumes": {k: getattr(args, k) for k in ("quotes", "stories", "blogs", "comments", "users", "posts")},
+        "concurrency": args.concurrency,
+        "scenarios": results,
+        "memory": memory,
+    }
+    path = os.path.join(BASELINE_DIR, f"{args.name}.json")
+    if args.compare:
+        if not os.path.exists(path):
+            print(f"no baseline at {path} — run with --save-baseline first")
+            return 1
+        with open(path) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+            return 1
+        print("\nno regressions against baseline")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nbaseline saved to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
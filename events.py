@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+from collections import deque
+from threading import Lock
+
+# =========================
+# IN-PROCESS PUB/SUB HUB
+# =========================
+# Endpoints publish small delta events ("like", "comment.add", ...) and every
+# connected /events client receives them as Server-Sent Events. Publishing is
+# safe from the threadpool (sync endpoints) as well as from the event loop.
+
+HEARTBEAT_SECONDS = 25
+SUBSCRIBER_QUEUE_SIZE = 256
+REPLAY_BUFFER_SIZE = 500
+
+
+class EventHub:
+    def __init__(self, replay_size: int = REPLAY_BUFFER_SIZE):
+        self._subscribers: set = set()   # {(loop, queue)}
+        self._history: deque = deque(maxlen=replay_size)
+        self._next_id = 1
+        self._lock = Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: str, data: dict):
+        """Encode once and fan out to every subscriber. Never blocks the caller."""
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            payload = json.dumps(data, separators=(",", ":"), default=str)
+            message = f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+            self._history.append((event_id, message))
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # Loop already closed — the subscriber is gone.
+                self._discard((loop, queue))
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, message: str):
+        if queue.full():
+            # Slow client: drop its backlog and ask it to resync from scratch.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait("event: resync\ndata: {}\n\n")
+            return
+        queue.put_nowait(message)
+
+    def _discard(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _replay_since(self, last_event_id) -> list[str] | None:
+        """Messages after `last_event_id`, or None if they've aged out of the buffer."""
+        try:
+            last = int(last_event_id)
+        except (TypeError, ValueError):
+            return []
+        with self._lock:
+            if not self._history or last >= self._history[-1][0]:
+                return []
+            if last < self._history[0][0] - 1:
+                return None
+            return [msg for eid, msg in self._history if eid > last]
+
+    async def stream(self, request, last_event_id: str = None):
+        """Async generator of SSE frames for one client, until it disconnects."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (loop, queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            yield f"retry: 5000\n: connected {int(time.time())}\n\n"
+            replayed_upto = 0
+            if last_event_id is not None:
+                missed = self._replay_since(last_event_id)
+                if missed is None:
+                    yield "event: resync\ndata: {}\n\n"
+                for message in missed or []:
+                    replayed_upto = _event_id(message)
+                    yield message
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    message = ": ping\n\n"
+                if 0 < _event_id(message) <= replayed_upto:
+                    continue  # already sent during replay
+                yield message
+        finally:
+            self._discard(subscriber)
+
+
+def _event_id(message: str) -> int:
+    if message.startswith("id: "):
+        return int(message[4:message.index("\n")])
+    return 0
+
+
+hub = EventHub()
@@ -1,14 +1,174 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import re
 import sys
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("app.log"),  # log file
-        logging.StreamHandler(sys.stdout)  # console output
-    ]
-)
+# =========================
+# NON-BLOCKING LOGGING
+# =========================
+# Request threads only format the message and push the record onto an
+# in-memory queue; a single QueueListener thread does the console/file I/O.
+# The file rotates by size, records are JSON (or plain text with
+# LOG_FORMAT=text) and carry the id of the request that produced them.
+#
+#   LOG_LEVEL      root level (INFO)
+#   LOG_LEVELS     per-logger overrides, e.g. "httpx=WARNING,main=DEBUG"
+#   LOG_FILE       path of the rotating file ("app.log"; empty disables it)
+#   LOG_MAX_BYTES  rotate after this many bytes (10 MB)
+#   LOG_BACKUPS    rotated files to keep (5)
+#   LOG_FORMAT     json | text (json)
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Third-party chatter (one INFO line per Supabase HTTP call) is off by default.
+DEFAULT_LEVELS = {
+    "httpx": "WARNING",
+    "httpcore": "WARNING",
+    "hpack": "WARNING",
+    "urllib3": "WARNING",
+    "passlib": "WARNING",
+}
+
+request_id_var: ContextVar = ContextVar("request_id", default="-")
+
+_listener: QueueListener | None = None
 
 logger = logging.getLogger()
+
+# Attributes every LogRecord has; anything else came from `extra=`.
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, request_id, msg, extras, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _RequestIdFilter(logging.Filter):
+    """Stamp the current request id — must run on the emitting thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Like the stock prepare(), but keep the traceback in exc_text instead
+        # of folding it into the message, so formatters can place it.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Route every logger through one background writer. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = (JsonFormatter() if LOG_FORMAT == "json"
+                 else logging.Formatter("%(asctime)s [%(levelname)s] [%(request_id)s] %(name)s: %(message)s"))
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if LOG_FILE:
+        handlers.append(RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                            backupCount=LOG_BACKUPS, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()   # unbounded — put() never blocks a request
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(_RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    # uvicorn installs its own synchronous handlers before importing the app.
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uv = logging.getLogger(name)
+        uv.handlers.clear()
+        uv.propagate = True
+
+    for name, level in {**DEFAULT_LEVELS, **_parse_levels(os.getenv("LOG_LEVELS", ""))}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)   # flush what's queued on shutdown
+
+
+# =========================
+# REQUEST IDS
+# =========================
+_VALID_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that assigns each request an id (reusing a sane incoming
+    X-Request-ID from the proxy), exposes it to log records through
+    `request_id_var` and echoes it back in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-request-id"), "")
+        request_id = incoming if _VALID_ID.match(incoming) else uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,4 +1,7 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import asyncio
+import hashlib
+import json
 import os
 import uuid
 import shutil
@@ -7,19 +10,37 @@ import mimetypes
 import logging
 import re
 import time
-from collections import defaultdict
-from threading import Lock
+from collections import Counter, defaultdict, deque
+from contextlib import asynccontextmanager
+from threading import Lock, Thread
 
 from fastapi import FastAPI, HTTPException, Depends, Header, File, Response, UploadFile, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordBearer
 
 
-from supabase import create_client
+import admission
+import metrics
+import ranking
+import related
+import snapshot
+import transfer
+import writequeue
+from events import hub
+from logging_setup import RequestIdMiddleware, setup_logging
+from metrics import MetricsMiddleware
+from profiler import ProfilerMiddleware, collapsed, profiler
+from repository import CoalescingRepository, InstrumentedRepository, create_repository
+from resilience import CircuitOpenError, ResilientRepository, is_transient
+from responses import ORJSONResponse, CompressionMiddleware, dumps, precompress, precompressed_response
+from schemas import BlogSchema, QuoteSchema, StorySchema
 from jose import jwt, JWTError
 from passlib.context import CryptContext
+from pydantic import ValidationError
 
 # =========================
 # CONFIG
@@ -28,6 +49,7 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 UPLOAD_DIR = "./uploads"
 STATIC_DIR = "./static"
+TEMPLATES_DIR = "./templates"
 FRONTEND_HTML = "index.html"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(STATIC_DIR, exist_ok=True)
@@ -40,9 +62,30 @@ MAX_UPLOAD_BYTES = 8 * 1024 * 1024  # 8 MB
 # Supabase Storage bucket — create in Dashboard: Storage → New bucket → "images" → Public ON
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "images")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Public origin used in canonical/OpenGraph URLs, e.g. https://quoteme.onrender.com
+SITE_URL = os.getenv("SITE_URL")
+
+# Data access goes through `db` — Supabase by default, or a local SQLite
+# database built on models.py with STORAGE_BACKEND=sqlite (see repository.py).
+# Layers, outermost first: identical concurrent reads share one upstream call;
+# reads are retried / short-circuited per table when the backend is failing
+# (resilience.py); every upstream execute() is timed for /metrics.
+db = CoalescingRepository(
+    ResilientRepository(InstrumentedRepository(create_repository(), metrics.observe_query)),
+    on_shared=metrics.observe_coalesced,
+)
+
+# Fire-and-forget writes (contact messages, last_seen) go through a local
+# write-behind queue and reach `db` in batches — see writequeue.py. Its file
+# is opened and flushed from the lifespan hook (see APP).
+write_queue = writequeue.WriteQueue(db)
+
+# Supabase Storage for uploads — None on the local backend, in which case
+# _save_image_bytes falls back to local disk.
+supabase = getattr(db, "client", None)
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+# Queue-backed: request threads never wait on console/file I/O (see logging_setup.py).
+setup_logging()
 logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -66,12 +109,173 @@ def _rate_limit(key: str, max_calls: int, window_seconds: int):
         # Prune old entries
         calls[:] = [t for t in calls if now - t < window_seconds]
         if len(calls) >= max_calls:
+            metrics.RATE_LIMITED.inc(key.partition(":")[0])
             raise HTTPException(
                 status_code=429,
                 detail=f"Too many requests. Please wait a moment and try again. 🙏"
             )
         calls.append(now)
 
+# =========================
+# SIMPLE IN-MEMORY CACHE
+# =========================
+_cache_store: dict = {}
+_cache_lock = Lock()
+
+def _cache_get(key: str, ttl_seconds: float):
+    """Return the cached value for `key` if younger than `ttl_seconds`, else None."""
+    with _cache_lock:
+        entry = _cache_store.get(key)
+    if entry and time.time() - entry[0] < ttl_seconds:
+        return entry[1]
+    return None
+
+def _cache_set(key: str, value):
+    with _cache_lock:
+        _cache_store[key] = (time.time(), value)
+
+def _cache_invalidate(*prefixes: str):
+    """Drop every cached entry whose key starts with one of `prefixes`."""
+    with _cache_lock:
+        for key in [k for k in _cache_store if k.startswith(prefixes)]:
+            del _cache_store[key]
+
+# =========================
+# BACKGROUND JOBS
+# =========================
+# Periodic jobs are declared next to the code they maintain but only start
+# from the app's lifespan hook (see APP), so importing main — a script, a
+# test, a worker about to fork — starts no threads.
+_periodic_jobs: list = []   # (name, seconds, job)
+_jobs_started = False
+
+def _run_periodically(name: str, seconds: float, job):
+    """Call `job()` every `seconds` on a daemon thread once the app starts; failures are logged and retried next round."""
+    if seconds > 0:
+        _periodic_jobs.append((name, seconds, job))
+
+def _start_periodic_jobs():
+    global _jobs_started
+    if _jobs_started:
+        return
+    _jobs_started = True
+    for name, seconds, job in _periodic_jobs:
+        def loop(name=name, seconds=seconds, job=job):
+            while True:
+                time.sleep(seconds)
+                try:
+                    job()
+                except Exception as e:
+                    logger.warning(f"{name} failed: {e}")
+
+        Thread(target=loop, name=name, daemon=True).start()
+
+def _run_once(name: str, job):
+    """Call `job()` once on a daemon thread, logging a failure instead of raising it."""
+    def run():
+        try:
+            job()
+        except Exception as e:
+            logger.warning(f"{name} failed: {e}")
+
+    Thread(target=run, name=name, daemon=True).start()
+
+# =========================
+# SCHEMA CAPABILITIES
+# =========================
+# Columns added by later migrations. Which ones exist is probed once (on first
+# use, and again via POST /admin/schema/probe after running a migration), so
+# endpoints choose the right query shape up front — one round trip, instead of
+# trying with the column, matching the error text and retrying without it.
+_OPTIONAL_COLUMNS = {
+    "comments": ("toxicity", "is_hidden"),
+    "quotes":   ("comment_count",),
+    "stories":  ("excerpt", "comment_count"),
+    "blogs":    ("excerpt", "comment_count"),
+    "forumpost": ("parent_id", "reply_count"),
+}
+_schema: dict | None = None   # table -> set of optional columns present
+_schema_lock = Lock()
+
+def _is_missing_column_error(e: Exception) -> bool:
+    err = str(e).lower()
+    return any(kw in err for kw in ("column", "42703", "pgrst204", "schema cache"))
+
+def _probe_column_set(table: str, columns: tuple) -> set:
+    try:
+        db.table(table).select(", ".join(columns)).limit(1).execute()
+        return set(columns)
+    except Exception as e:
+        if not _is_missing_column_error(e):
+            # Upstream trouble, not a schema answer — assume the migrated shape.
+            logger.warning(f"schema probe {table}: {e} — assuming {columns} exist")
+            return set(columns)
+    if len(columns) == 1:
+        return set()
+    present = set()
+    for column in columns:
+        present |= _probe_column_set(table, (column,))
+    return present
+
+def _probe_schema() -> dict:
+    """Detect which optional columns exist. One query per table when all do."""
+    global _schema
+    found = {table: _probe_column_set(table, columns) for table, columns in _OPTIONAL_COLUMNS.items()}
+    missing = {t: sorted(set(c) - found[t]) for t, c in _OPTIONAL_COLUMNS.items() if set(c) - found[t]}
+    if missing:
+        logger.warning(f"Optional columns missing (run the migrations, then POST /admin/schema/probe): {missing}")
+    _schema = found
+    return found
+
+def _has_column(table: str, column: str) -> bool:
+    """True if optional `column` exists on `table` (probes lazily on first call)."""
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                _probe_schema()
+    return column in _schema.get(table, ())
+
+def _columns(table: str, *names: str) -> str:
+    """Select list of `names`, minus optional columns this database doesn't have."""
+    optional = _OPTIONAL_COLUMNS.get(table, ())
+    return ", ".join(n for n in names if n not in optional or _has_column(table, n))
+
+# =========================
+# LAST-KNOWN-GOOD CONTENT
+# =========================
+# Public content reads remember their latest successful result. If the data
+# layer then fails transiently (circuit open, timeout, upstream 5xx) the
+# endpoint answers with that copy — marked stale — instead of a 500.
+STALE_MAX_ENTRIES = 256
+_stale_store: dict = {}
+_stale_lock = Lock()
+
+def _last_good(key: str, fetch, response: Response = None):
+    """Return fetch(), falling back to the last good result for `key` on outages."""
+    try:
+        data = fetch()
+    except Exception as e:
+        if not is_transient(e):
+            raise
+        with _stale_lock:
+            entry = _stale_store.get(key)
+        if entry is None:
+            logger.error(f"'{key}' unavailable and nothing cached: {e}")
+            retry_in = max(int(getattr(e, "retry_in", 5)), 1)
+            raise HTTPException(status_code=503, detail="Temporarily unavailable — please try again shortly.",
+                                headers={"Retry-After": str(retry_in)})
+        age = int(time.time() - entry[0])
+        logger.warning(f"Serving stale '{key}' ({age}s old): {e}")
+        if response is not None:
+            response.headers["Warning"] = '110 - "Response is Stale"'
+            response.headers["X-Stale-Age"] = str(age)
+        return entry[1]
+    with _stale_lock:
+        if key not in _stale_store and len(_stale_store) >= STALE_MAX_ENTRIES:
+            del _stale_store[next(iter(_stale_store))]
+        _stale_store[key] = (time.time(), data)
+    return data
+
 def _client_ip(request: Request) -> str:
     """Extract client IP, respecting reverse-proxy headers."""
     xff = request.headers.get("x-forwarded-for")
@@ -82,7 +286,17 @@ def _client_ip(request: Request) -> str:
 # =========================
 # APP
 # =========================
-app = FastAPI(title="QuoteMe Supabase API")
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """Warm caches from the last snapshot, then start the background workers, before serving."""
+    await run_in_threadpool(_warm_from_snapshot)
+    snapshot.start_refresher(_refresh_snapshot)
+    write_queue.start()
+    _run_once("counters-build", _refresh_counters)
+    _start_periodic_jobs()
+    yield
+
+app = FastAPI(title="QuoteMe Supabase API", default_response_class=ORJSONResponse, lifespan=_lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -109,6 +323,30 @@ async def security_headers_middleware(request: Request, call_next):
     response.headers["X-XSS-Protection"] = "1; mode=block"
     return response
 
+# Compress JSON/HTML bodies after the headers above are set.
+app.add_middleware(CompressionMiddleware)
+
+# Off unless enabled via PUT /admin/profiler.
+app.add_middleware(ProfilerMiddleware)
+
+# Per-class concurrency limits; sheds with 503 + Retry-After when saturated.
+app.add_middleware(admission.AdmissionMiddleware)
+
+# Latency includes every other middleware, compression too.
+app.add_middleware(MetricsMiddleware)
+
+# Outermost: every log line emitted while handling a request carries its id.
+app.add_middleware(RequestIdMiddleware)
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """Fail fast with 503 while a table's breaker is open."""
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "Temporarily unavailable — please try again shortly."},
+        headers={"Retry-After": str(max(int(exc.retry_in), 1))},
+    )
+
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
@@ -126,8 +364,12 @@ def dashboard_page():
     return FileResponse("static/dashboard.html")
 
 @app.get("/story/{story_id}")
-def story_page(story_id: int):
-    return FileResponse("static/story.html")
+def story_page(story_id: int, request: Request):
+    return _render_item_page(request, "story", story_id)
+
+@app.get("/blog/{blog_id}")
+def blog_page(blog_id: int, request: Request):
+    return _render_item_page(request, "blog", blog_id)
 
 @app.get("/privacy")
 def privacy_page():
@@ -250,7 +492,7 @@ def admin_login(data: dict, request: Request):
 
     username = username_input.strip().lower()
 
-    res = supabase.table("admins")\
+    res = db.table("admins")\
         .select("*")\
         .ilike("username", username)\
         .execute()
@@ -277,20 +519,22 @@ def admin_login(data: dict, request: Request):
 
 
 @app.get("/settings")
-def settings_alias():
-    res = supabase.table("admin_settings").select("*").limit(1).execute()
-    return res.data[0] if res.data else {}
+def settings_alias(response: Response = None):
+    def fetch():
+        res = db.table("admin_settings").select("*").limit(1).execute()
+        return res.data[0] if res.data else {}
+    return _last_good("settings", fetch, response)
 
 @app.get("/admin/settings")
 def get_admin_settings(username: str = Depends(require_admin)):
-    admin = supabase.table("admins").select("*").eq("username", username).execute().data
+    admin = db.table("admins").select("*").eq("username", username).execute().data
 
     if not admin:
         raise HTTPException(status_code=404, detail="Admin not found")
 
     admin_id = admin[0]["id"]
 
-    res = supabase.table("admin_settings")\
+    res = db.table("admin_settings")\
         .select("*")\
         .eq("admin_id", admin_id)\
         .execute()
@@ -301,17 +545,18 @@ def get_admin_settings(username: str = Depends(require_admin)):
 @app.put("/admin/settings")
 def update_settings(data: dict, username: str = Depends(require_admin)):
     # get admin id first
-    admin = supabase.table("admins").select("*").eq("username", username).execute().data
+    admin = db.table("admins").select("*").eq("username", username).execute().data
 
     if not admin:
         raise HTTPException(status_code=404, detail="Admin not found")
 
     admin_id = admin[0]["id"]
 
-    res = supabase.table("admin_settings")\
+    res = db.table("admin_settings")\
         .update(data)\
         .eq("admin_id", admin_id)\
         .execute()
+    _cache_invalidate("bootstrap")
 
     return {"success": True, "data": res.data}
 
@@ -322,21 +567,132 @@ def update_settings(data: dict, username: str = Depends(require_admin)):
 @app.get("/admin/stats")
 def stats(username: str = Depends(require_admin)):
     try:
-        users = supabase.table(USER_TABLE).select("id, is_banned").execute().data or []
-        comments = supabase.table("comments").select("id, toxicity").execute().data or []
+        counts = _moderation_counts()
         return {
-            "quotes":    len(supabase.table("quotes").select("id").execute().data),
-            "stories":   len(supabase.table("stories").select("id").execute().data),
-            "blogs":     len(supabase.table("blogs").select("id").execute().data),
-            "comments":  len(comments),
-            "forumpost": len(supabase.table("forumpost").select("id").execute().data),
-            "users":     len(users),
-            "flagged_comments": sum(1 for c in comments if (c.get("toxicity") or 0) >= 0.7),
+            "quotes":    len(db.table("quotes").select("id").execute().data),
+            "stories":   len(db.table("stories").select("id").execute().data),
+            "blogs":     len(db.table("blogs").select("id").execute().data),
+            "comments":  counts.get("comments.total", 0),
+            "forumpost": len(db.table("forumpost").select("id").execute().data),
+            "users":     counts.get("users.total", 0),
+            "flagged_comments": counts.get("comments.flagged", 0),
         }
     except Exception as e:
         logger.error(f"stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# =========================
+# METRICS
+# =========================
+metrics.collector("quoteme_sse_subscribers", "Connected /events clients.", lambda: hub.subscriber_count)
+metrics.collector("quoteme_cache_entries", "Entries in the in-memory response cache.", lambda: len(_cache_store))
+
+@app.get("/metrics")
+def get_metrics(username: str = Depends(require_admin)):
+    """Admin — per-route latency, status counts, DB timings, rate-limit rejections (Prometheus text format)."""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# =========================
+# SCHEMA
+# =========================
+@app.get("/admin/schema")
+def get_schema(username: str = Depends(require_admin)):
+    """Admin — which optional (migration-added) columns this database has."""
+    return {table: {c: _has_column(table, c) for c in cols} for table, cols in _OPTIONAL_COLUMNS.items()}
+
+@app.post("/admin/schema/probe")
+def reprobe_schema(username: str = Depends(require_admin)):
+    """Admin — re-detect optional columns, e.g. right after running a migration."""
+    with _schema_lock:
+        found = _probe_schema()
+    _cache_invalidate("bootstrap", "page:")
+    logger.info(f"Schema re-probed by admin '{username}'")
+    return {table: {c: c in found[table] for c in cols} for table, cols in _OPTIONAL_COLUMNS.items()}
+
+@app.post("/admin/counters/rebuild")
+def rebuild_counters(username: str = Depends(require_admin)):
+    """Admin — recount moderation totals from the database, e.g. after editing rows by hand."""
+    try:
+        _refresh_counters()
+        return _moderation_counts()
+    except Exception as e:
+        logger.error(f"rebuild_counters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# =========================
+# RESILIENCE
+# =========================
+metrics.collector("quoteme_circuits_open", "Tables whose circuit breaker is open.",
+                  lambda: sum(1 for b in db.status().values() if b["state"] != "closed"))
+metrics.collector("quoteme_write_queue_depth", "Writes waiting in the write-behind queue.",
+                  lambda: write_queue.status().get("depth", 0))
+metrics.collector("quoteme_write_queue_lag_seconds", "Age of the oldest write still waiting in the queue.",
+                  lambda: write_queue.status().get("lag_seconds", 0))
+metrics.collector("quoteme_write_queue_dead", "Queued writes upstream rejected, parked until retried.",
+                  lambda: write_queue.status().get("dead", 0))
+
+@app.get("/admin/health")
+def get_health(username: str = Depends(require_admin)):
+    """Admin — circuit breakers, last-known-good cache size, admission queues and the write queue."""
+    return {
+        "backend": db.backend,
+        "circuits": db.status(),
+        "stale_entries": len(_stale_store),
+        "admission": admission.status(),
+        "write_queue": write_queue.status(),
+    }
+
+@app.post("/admin/write-queue/retry")
+def retry_write_queue(username: str = Depends(require_admin)):
+    """Admin — requeue writes upstream rejected, e.g. after running a missing migration."""
+    requeued = write_queue.retry_dead()
+    logger.info(f"Admin '{username}' requeued {requeued} dead writes")
+    return {"requeued": requeued, **write_queue.status()}
+
+# =========================
+# PROFILER
+# =========================
+@app.get("/admin/profiler")
+def get_profiler(username: str = Depends(require_admin)):
+    """Admin — profiler settings and the captured profiles (without stacks)."""
+    return profiler.status()
+
+@app.put("/admin/profiler")
+def update_profiler(data: dict, username: str = Depends(require_admin)):
+    """
+    Admin — turn the sampling profiler on/off and tune it.
+    Body: {"enabled": bool, "sample_rate": 0..1, "slow_ms": float}
+    """
+    try:
+        profiler.configure(
+            enabled=data.get("enabled"),
+            sample_rate=data.get("sample_rate"),
+            slow_ms=data.get("slow_ms"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"Profiler updated by {username}: enabled={profiler.enabled} "
+                f"sample_rate={profiler.sample_rate} slow_ms={profiler.slow_ms}")
+    return profiler.status()
+
+@app.delete("/admin/profiler")
+def clear_profiles(username: str = Depends(require_admin)):
+    """Admin — drop all captured profiles."""
+    profiler.clear()
+    return {"success": True}
+
+@app.get("/admin/profiler/{profile_id}")
+def download_profile(profile_id: int, username: str = Depends(require_admin)):
+    """Admin — one profile as collapsed stacks, ready for flamegraph.pl or speedscope."""
+    profile = profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have rotated out)")
+    return Response(
+        collapsed(profile),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+    )
+
 # =========================
 # UPLOAD IMAGE
 # =========================
@@ -349,17 +705,18 @@ def _save_image_bytes(file_bytes: bytes, ext: str) -> dict:
     content_type = mimetypes.guess_type(filename)[0] or "image/jpeg"
 
     # ── Primary: Supabase Storage (persistent) ──
-    try:
-        supabase.storage.from_(SUPABASE_BUCKET).upload(
-            path=filename,
-            file=file_bytes,
-            file_options={"content-type": content_type, "upsert": "true"}
-        )
-        public_url = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(filename)
-        logger.info(f"Supabase Storage upload OK: {filename}")
-        return {"success": True, "url": public_url}
-    except Exception as e:
-        logger.warning(f"Supabase Storage upload failed ({e}) — falling back to local disk")
+    if supabase is not None:
+        try:
+            supabase.storage.from_(SUPABASE_BUCKET).upload(
+                path=filename,
+                file=file_bytes,
+                file_options={"content-type": content_type, "upsert": "true"}
+            )
+            public_url = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(filename)
+            logger.info(f"Supabase Storage upload OK: {filename}")
+            return {"success": True, "url": public_url}
+        except Exception as e:
+            logger.warning(f"Supabase Storage upload failed ({e}) — falling back to local disk")
 
     # ── Fallback: local disk (lost on redeploy, but better than nothing) ──
     path = os.path.join(UPLOAD_DIR, filename)
@@ -422,33 +779,194 @@ async def upload_public(request: Request, file: UploadFile = File(...)):
     _rate_limit(f"upload-public:{_client_ip(request)}", max_calls=10, window_seconds=600)
     file_bytes, ext = await _validate_and_read_upload(file)
     return _save_image_bytes(file_bytes, ext)
+# =========================
+# FIELD PROJECTION / CARD VIEW
+# =========================
+# Columns a client may request via ?fields=a,b,c — anything else is rejected
+# so callers can't probe arbitrary columns through PostgREST.
+_PUBLIC_COLUMNS = {
+    "quotes":  {"id", "text", "author", "image_url", "likes", "comment_count"},
+    "stories": {"id", "title", "content", "excerpt", "image_url", "likes", "comment_count", "created_at"},
+    "blogs":   {"id", "title", "content", "excerpt", "image_url", "likes", "comment_count", "created_at"},
+}
+
+# ?view=card — what the homepage carousels actually render
+_CARD_COLUMNS = {
+    "quotes":  "id, text, author, image_url, likes, comment_count",
+    "stories": "id, title, excerpt, image_url, likes, comment_count, created_at",
+    "blogs":   "id, title, excerpt, image_url, likes, comment_count, created_at",
+}
+
+EXCERPT_LEN = 200
+
+# One-time Supabase setup (SQL editor):
+#   alter table stories add column if not exists excerpt varchar(300);
+#   alter table blogs   add column if not exists excerpt varchar(300);
+# then POST /admin/excerpts/rebuild once to backfill existing rows.
+
+def _excerpt(content: str, max_len: int = EXCERPT_LEN) -> str:
+    """Plain-text teaser of `content`, cut on a word boundary."""
+    text = " ".join(_strip_html(content).split())
+    if len(text) <= max_len:
+        return text
+    cut = text[:max_len].rsplit(" ", 1)[0]
+    return cut.rstrip(",.;:—-") + "…"
+
+def _with_excerpt(table: str, data: dict) -> dict:
+    """Keep the stored excerpt in sync whenever content is written."""
+    if "content" in data and _has_column(table, "excerpt"):
+        data = {**data, "excerpt": _excerpt(data.get("content") or "")}
+    return data
+
+def _select_columns(table: str, fields: str = None, view: str = None) -> str:
+    """Resolve ?fields= / ?view= into a PostgREST select string."""
+    if fields:
+        wanted = [f.strip() for f in fields.split(",") if f.strip()]
+        allowed = {c for c in _PUBLIC_COLUMNS[table]
+                   if c not in _OPTIONAL_COLUMNS.get(table, ()) or _has_column(table, c)}
+        unknown = [f for f in wanted if f not in allowed]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+        if "id" not in wanted:
+            wanted.insert(0, "id")
+        return ", ".join(wanted)
+    if view == "card":
+        columns = _CARD_COLUMNS[table]
+        if table in ("stories", "blogs") and not _has_column(table, "excerpt"):
+            # Pre-migration: send content, the client truncates it.
+            columns = columns.replace("excerpt", "content")
+        return _columns(table, *columns.split(", "))
+    if view and view != "full":
+        raise HTTPException(status_code=400, detail="view must be 'card' or 'full'")
+    return "*"
+
+
 # =========================
 # QUOTES
 # =========================
 @app.get("/quotes")
-def get_quotes():
+def get_quotes(response: Response = None, fields: str = None, view: str = None,
+               limit: int = None, offset: int = 0):
+    columns = _select_columns("quotes", fields, view)
+
+    def fetch():
+        query = db.table("quotes").select(columns)
+        if limit:
+            query = query.order("id", desc=True).range(offset, offset + limit - 1)
+        return query.execute().data
+
     try:
-        res = supabase.table("quotes").select("*").execute()
-        return res.data
+        return _last_good(f"quotes:{columns}:{limit}:{offset}", fetch, response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+# ── quote of the day / rotation ──
+# Every quote gets a per-day sort key hashed from (date, id), so all workers
+# agree on the order without talking to each other, and adding or removing a
+# quote doesn't reshuffle the rest. The first entry is the quote of the day.
+#
+# The card rows are kept in memory in rotation order, so every read is a
+# lookup. They're rebuilt on the first read of a new day and after a quote is
+# created, edited or deleted; likes and comment counts are patched into the
+# cached rows as they change. Invalidation bumps _rotation_generation under
+# the same lock the build holds, and a build is only current while its
+# generation is the latest, so an edit can never be lost to a racing build.
+_rotation: dict | None = None   # {"date", "generation", "quotes": card rows in rotation order, "by_id"}
+_rotation_generation = 0
+_rotation_lock = Lock()
+
+def _build_rotation(day: str, generation: int) -> dict:
+    rows = db.table("quotes").select(_select_columns("quotes", view="card")).execute().data or []
+    rows.sort(key=lambda r: hashlib.blake2b(f"{day}:{r['id']}".encode(), digest_size=8).digest())
+    return {"date": day, "generation": generation, "quotes": rows, "by_id": {r["id"]: r for r in rows}}
+
+def _quote_rotation() -> dict:
+    global _rotation
+    day = datetime.now(timezone.utc).date().isoformat()
+
+    def stale(r):
+        return r is None or r["date"] != day or r["generation"] != _rotation_generation
+
+    current = _rotation
+    if stale(current):
+        with _rotation_lock:
+            current = _rotation
+            if stale(current):
+                try:
+                    current = _rotation = _build_rotation(day, _rotation_generation)
+                except Exception as e:
+                    if current is None or not is_transient(e):
+                        raise
+                    logger.warning(f"quote rotation not rebuilt, still serving {current['date']}: {e}")
+    return current
+
+def _invalidate_rotation():
+    global _rotation_generation
+    with _rotation_lock:
+        _rotation_generation += 1
+
+def _patch_rotation(quote_id, **values):
+    """Copy a new likes / comment_count into the cached card, if it's there."""
+    current = _rotation
+    row = current["by_id"].get(quote_id) if current else None
+    if row is not None:
+        row.update(values)
+
+@app.get("/quotes/today")
+def quote_of_the_day():
+    """Public — today's quote, the same for every visitor until midnight UTC."""
+    try:
+        quotes = _quote_rotation()["quotes"]
     except Exception as e:
+        logger.error(f"quote_of_the_day: {e}")
         raise HTTPException(500, str(e))
+    if not quotes:
+        raise HTTPException(status_code=404, detail="No quotes yet")
+    return quotes[0]
+
+@app.get("/quotes/rotation")
+def quote_rotation(limit: int = None, offset: int = 0):
+    """Public — every quote in today's carousel order, starting with the quote of the day."""
+    try:
+        rotation = _quote_rotation()
+    except Exception as e:
+        logger.error(f"quote_rotation: {e}")
+        raise HTTPException(500, str(e))
+    quotes = rotation["quotes"]
+    return {
+        "date":   rotation["date"],
+        "total":  len(quotes),
+        "quotes": quotes[offset:offset + limit] if limit else quotes[offset:],
+    }
 
 
 @app.post("/quotes")
 def create_quote(data: dict, username: str = Depends(require_admin)):
-    res = supabase.table("quotes").insert(data).execute()
+    res = db.table("quotes").insert(data).execute()
+    _cache_invalidate("bootstrap")
+    _invalidate_rotation()
+    _related_changed("quote", res.data)
     return res.data
 
 
 @app.put("/quotes/{quote_id}")
 def update_quote(quote_id: int, data: dict, username: str = Depends(require_admin)):
-    res = supabase.table("quotes").update(data).eq("id", quote_id).execute()
+    res = db.table("quotes").update(data).eq("id", quote_id).execute()
+    _cache_invalidate("bootstrap")
+    _invalidate_rotation()
+    _related_changed("quote", res.data)
     return res.data
 
 
 @app.delete("/quotes/{quote_id}")
 def delete_quote(quote_id: int, username: str = Depends(require_admin)):
-    supabase.table("quotes").delete().eq("id", quote_id).execute()
+    db.table("quotes").delete().eq("id", quote_id).execute()
+    _cache_invalidate("bootstrap")
+    _invalidate_rotation()
+    _related_removed("quote", quote_id)
     return {"message": "Deleted"}
 
 
@@ -456,16 +974,24 @@ def delete_quote(quote_id: int, username: str = Depends(require_admin)):
 # STORIES
 # =========================
 @app.get("/stories")
-def get_stories(limit: int = 15, offset: int = 0):
-    try:
-        res = (
-            supabase.table("stories")
-            .select("*")
+def get_stories(response: Response = None, limit: int = 15, offset: int = 0,
+                fields: str = None, view: str = None):
+    columns = _select_columns("stories", fields, view)
+
+    def fetch():
+        return (
+            db.table("stories")
+            .select(columns)
             .order("id", desc=True)
             .range(offset, offset + limit - 1)
             .execute()
+            .data
         )
-        return res.data
+
+    try:
+        return _last_good(f"stories:{columns}:{limit}:{offset}", fetch, response)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"get_stories: {e}")
         raise HTTPException(500, str(e))
@@ -474,7 +1000,7 @@ def get_stories(limit: int = 15, offset: int = 0):
 @app.get("/stories/{story_id}")
 def get_story(story_id: int):
     try:
-        res = supabase.table("stories").select("*").eq("id", story_id).execute()
+        res = db.table("stories").select("*").eq("id", story_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="Story not found")
         return res.data[0]
@@ -487,24 +1013,33 @@ def get_story(story_id: int):
 
 @app.post("/stories")
 def create_story(data: dict, username: str = Depends(require_admin)):
-    return supabase.table("stories").insert(data).execute().data
+    res = db.table("stories").insert(_with_excerpt("stories", data)).execute()
+    _cache_invalidate("bootstrap")
+    _related_changed("story", res.data)
+    return res.data
 
 @app.put("/stories/{story_id}")
 def update_story(story_id: int, data: dict, username: str = Depends(require_admin)):
-    res = supabase.table("stories").update(data).eq("id", story_id).execute()
+    res = db.table("stories").update(_with_excerpt("stories", data)).eq("id", story_id).execute()
+    _cache_invalidate("bootstrap")
+    _invalidate_item_page("story", story_id)
+    _related_changed("story", res.data)
     if not res.data:
         raise HTTPException(status_code=404, detail="Story not found")
     return res.data
 
 @app.delete("/stories/{story_id}")
 def delete_story(story_id: int, username: str = Depends(require_admin)):
-    supabase.table("stories").delete().eq("id", story_id).execute()
+    db.table("stories").delete().eq("id", story_id).execute()
+    _cache_invalidate("bootstrap")
+    _invalidate_item_page("story", story_id)
+    _related_removed("story", story_id)
     logger.info(f"Story {story_id} deleted by admin")
     return {"message": "Story deleted", "id": story_id}
 
 @app.get("/stories/count")
 def stories_count():
-    res = supabase.table("stories").select("id", count="exact").execute()
+    res = db.table("stories").select("id", count="exact").execute()
     return {"count": res.count}
 
 
@@ -512,21 +1047,27 @@ def stories_count():
 # BLOGS
 # =========================
 @app.get("/blogs")
-def get_blogs(limit: int = 6, offset: int = 0):
-    return (
-        supabase.table("blogs")
-        .select("*")
-        .order("id", desc=True)
-        .range(offset, offset + limit - 1)
-        .execute()
-        .data
-    )
+def get_blogs(response: Response = None, limit: int = 6, offset: int = 0,
+              fields: str = None, view: str = None):
+    columns = _select_columns("blogs", fields, view)
+
+    def fetch():
+        return (
+            db.table("blogs")
+            .select(columns)
+            .order("id", desc=True)
+            .range(offset, offset + limit - 1)
+            .execute()
+            .data
+        )
+
+    return _last_good(f"blogs:{columns}:{limit}:{offset}", fetch, response)
 
 
 @app.get("/blogs/{blog_id}")
 def get_blog(blog_id: int):
     try:
-        res = supabase.table("blogs").select("*").eq("id", blog_id).execute()
+        res = db.table("blogs").select("*").eq("id", blog_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="Blog not found")
         return res.data[0]
@@ -539,22 +1080,324 @@ def get_blog(blog_id: int):
 
 @app.post("/blogs")
 def create_blog(data: dict, username: str = Depends(require_admin)):
-    return supabase.table("blogs").insert(data).execute().data
+    res = db.table("blogs").insert(_with_excerpt("blogs", data)).execute()
+    _cache_invalidate("bootstrap")
+    _related_changed("blog", res.data)
+    return res.data
 
 @app.put("/blogs/{blog_id}")
 def update_blog(blog_id: int, data: dict, username: str = Depends(require_admin)):
-    res = supabase.table("blogs").update(data).eq("id", blog_id).execute()
+    res = db.table("blogs").update(_with_excerpt("blogs", data)).eq("id", blog_id).execute()
+    _cache_invalidate("bootstrap")
+    _invalidate_item_page("blog", blog_id)
+    _related_changed("blog", res.data)
     if not res.data:
         raise HTTPException(status_code=404, detail="Blog not found")
     return res.data
 
 @app.delete("/blogs/{blog_id}")
 def delete_blog(blog_id: int, username: str = Depends(require_admin)):
-    supabase.table("blogs").delete().eq("id", blog_id).execute()
+    db.table("blogs").delete().eq("id", blog_id).execute()
+    _cache_invalidate("bootstrap")
+    _invalidate_item_page("blog", blog_id)
+    _related_removed("blog", blog_id)
     logger.info(f"Blog {blog_id} deleted by admin")
     return {"message": "Blog deleted", "id": blog_id}
 
 
+@app.post("/admin/excerpts/rebuild")
+def rebuild_excerpts(username: str = Depends(require_admin)):
+    """Admin — backfill/refresh the stored excerpt on every story and blog."""
+    if not (_has_column("stories", "excerpt") and _has_column("blogs", "excerpt")):
+        raise HTTPException(status_code=400, detail="excerpt column missing — run the migration, then POST /admin/schema/probe")
+    updated = {}
+    try:
+        for table in ("stories", "blogs"):
+            rows = db.table(table).select("id, content, excerpt").execute().data or []
+            count = 0
+            for r in rows:
+                excerpt = _excerpt(r.get("content") or "")
+                if excerpt != r.get("excerpt"):
+                    db.table(table).update({"excerpt": excerpt}).eq("id", r["id"]).execute()
+                    count += 1
+            updated[table] = count
+    except Exception as e:
+        logger.error(f"rebuild_excerpts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"Admin '{username}' rebuilt excerpts: {updated}")
+    return {"success": True, "updated": updated}
+
+
+# =========================
+# RELATED CONTENT
+# =========================
+# "You may also like" and the chatbot's content search, both served from the
+# in-memory index in related.py. Loaded from the content snapshot at boot (or
+# built on first use), rebuilt from the database every RELATED_REBUILD_SECONDS,
+# and patched row by row on admin create/update/delete in between. Cards live
+# in the index, so reads never touch the database.
+RELATED_REBUILD_SECONDS = float(os.getenv("RELATED_REBUILD_SECONDS", str(6 * 3600)))
+_RELATED_COLUMNS = {
+    "quotes":  "id, text, author, image_url",
+    "stories": "id, title, content, image_url",
+    "blogs":   "id, title, content, image_url",
+}
+
+_related = related.RelatedIndex()
+_related_lock = Lock()
+_related_from_snapshot = False   # rebuild from the database on the first snapshot refresh
+
+def _related_document(item_type: str, row: dict) -> tuple:
+    """(key, title, body, card) for one quote/story/blog row."""
+    if item_type == "quote":
+        title, body = row.get("author") or "", row.get("text") or ""
+        card = {"item_type": item_type, "id": row["id"], "text": row.get("text"),
+                "author": row.get("author"), "image_url": row.get("image_url")}
+    else:
+        title, body = row.get("title") or "", _strip_html(row.get("content") or "")
+        card = {"item_type": item_type, "id": row["id"], "title": title,
+                "excerpt": _excerpt(row.get("content") or "", 160), "image_url": row.get("image_url")}
+    return (item_type, row["id"]), title, body, card
+
+def _rebuild_related():
+    docs = []
+    for item_type, table in _TYPE_TO_TABLE.items():
+        for row in db.table(table).select(_RELATED_COLUMNS[table]).execute().data or []:
+            docs.append(_related_document(item_type, row))
+    _related.build(docs)
+    logger.info(f"Related-content index rebuilt over {len(docs)} items")
+
+def _ensure_related():
+    if not _related.built_at:
+        with _related_lock:
+            if not _related.built_at:
+                _rebuild_related()
+
+def _related_changed(item_type: str, rows: list):
+    """Re-index created/edited rows. Never fails the admin request."""
+    try:
+        for row in rows or []:
+            _related.upsert(*_related_document(item_type, row))
+    except Exception as e:
+        logger.warning(f"related index not updated for {item_type}: {e}")
+
+def _related_removed(item_type: str, item_id: int):
+    try:
+        _related.remove((item_type, item_id))
+    except Exception as e:
+        logger.warning(f"related index not updated for {item_type} {item_id}: {e}")
+
+def _related_items(item_type: str, item_id: int, limit: int) -> list:
+    limit = max(1, min(limit, related.RELATED_TOP_N))
+    return [{**card, "score": score} for card, score in _related.related((item_type, item_id), limit)]
+
+@app.get("/related/{item_type}/{item_id}")
+def get_related(item_type: str, item_id: int, limit: int = 5):
+    """Public — the quotes, stories and blogs most similar to this one (TF-IDF cosine)."""
+    if item_type not in _TYPE_TO_TABLE:
+        raise HTTPException(status_code=400, detail=f"Invalid item_type '{item_type}'. Must be quote, story, or blog.")
+    try:
+        _ensure_related()
+    except Exception as e:
+        logger.error(f"get_related: {e}")
+        raise HTTPException(500, str(e))
+    return _related_items(item_type, item_id, limit)
+
+_run_periodically("related-rebuild", RELATED_REBUILD_SECONDS, _rebuild_related)
+
+
+# =========================
+# CONTENT IMPORT / EXPORT
+# =========================
+# Bulk-load or back up quotes, stories and blogs as NDJSON or CSV (see
+# transfer.py). Imports validate each record with the same schema as the
+# admin forms, insert in IMPORT_BATCH_ROWS batches, and report bad records by
+# line number without stopping. Imported items get new ids; likes and counts
+# start at zero. Exports carry every column and stream page by page.
+IMPORT_MAX_ERRORS = 50
+_IMPORT_SCHEMAS = {"quote": QuoteSchema, "story": StorySchema, "blog": BlogSchema}
+_EXPORT_COLUMNS = {
+    "quotes":  ("id", "text", "author", "image_url", "likes", "comment_count"),
+    "stories": ("id", "title", "content", "excerpt", "image_url", "likes", "comment_count", "created_at"),
+    "blogs":   ("id", "title", "content", "excerpt", "image_url", "likes", "comment_count", "created_at"),
+}
+
+def _transfer_table(item_type: str) -> str:
+    table = _TYPE_TO_TABLE.get(item_type)
+    if not table:
+        raise HTTPException(status_code=400, detail="item_type must be 'quote', 'story', or 'blog'")
+    return table
+
+def _validation_message(e: ValueError) -> str:
+    if isinstance(e, ValidationError):
+        first = e.errors()[0]
+        return f"{'.'.join(str(p) for p in first['loc']) or 'record'}: {first['msg']}"
+    return str(e)
+
+def _import_batch(table: str, rows: list) -> int:
+    if table != "quotes":
+        rows = [_with_excerpt(table, r) for r in rows]
+    return len(db.table(table).insert(rows).execute().data or [])
+
+
+@app.post("/admin/import/{item_type}")
+async def import_content(item_type: str, request: Request, format: str = None, dry_run: bool = False,
+                         username: str = Depends(require_admin)):
+    """
+    Admin — create quotes/stories/blogs from a streamed NDJSON or CSV body.
+    The format comes from ?format= or the Content-Type; ?dry_run=true only validates.
+    """
+    table = _transfer_table(item_type)
+    fmt = transfer.format_for(request.headers.get("content-type"), format)
+    if not fmt:
+        raise HTTPException(status_code=400, detail="Send NDJSON or CSV (Content-Type or ?format=ndjson|csv)")
+    schema = _IMPORT_SCHEMAS[item_type]
+
+    imported, failed, errors, batch = 0, 0, [], []
+    try:
+        async for line_no, record in transfer.iter_records(request.stream(), fmt):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                batch.append(schema.model_validate(record).model_dump())
+            except ValueError as e:
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({"line": line_no, "error": _validation_message(e)})
+                continue
+            if len(batch) >= transfer.IMPORT_BATCH_ROWS:
+                imported += len(batch) if dry_run else await run_in_threadpool(_import_batch, table, batch)
+                batch = []
+        if batch:
+            imported += len(batch) if dry_run else await run_in_threadpool(_import_batch, table, batch)
+    except Exception as e:
+        logger.error(f"import_content {item_type}: stopped after {imported} rows: {e}")
+        raise HTTPException(status_code=500, detail=f"Import stopped after {imported} rows: {e}")
+    finally:
+        if imported and not dry_run:
+            _cache_invalidate("bootstrap")
+            if item_type == "quote":
+                _invalidate_rotation()
+            if _related.built_at:
+                # One rebuild in the background rather than an upsert per imported row.
+                _run_once("related-rebuild", _rebuild_related)
+
+    logger.info(f"Admin '{username}' imported {imported} {table} ({failed} rejected)" + (" [dry run]" if dry_run else ""))
+    return {"imported": imported, "failed": failed, "errors": errors, "dry_run": dry_run}
+
+
+@app.get("/admin/export/{item_type}")
+def export_content(item_type: str, format: str = "ndjson", username: str = Depends(require_admin)):
+    """Admin — stream every quote/story/blog as NDJSON (default) or CSV, oldest first."""
+    table = _transfer_table(item_type)
+    fmt = transfer.format_for(None, format)
+    if not fmt:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    columns = _columns(table, *_EXPORT_COLUMNS[table])
+
+    def fetch_page(after_id: int) -> list:
+        try:
+            return (db.table(table).select(columns).gt("id", after_id).order("id")
+                    .limit(transfer.EXPORT_PAGE_ROWS).execute().data or [])
+        except Exception as e:
+            logger.error(f"export_content {table} after id {after_id}: {e}")
+            raise
+
+    filename = f"{table}-{datetime.utcnow():%Y%m%d}.{'csv' if fmt == 'csv' else 'ndjson'}"
+    logger.info(f"Admin '{username}' exported {table} as {fmt}")
+    return StreamingResponse(
+        transfer.export_pages(fetch_page, [c.strip() for c in columns.split(",")], fmt),
+        media_type=transfer.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# =========================
+# SERVER-RENDERED STORY / BLOG PAGES
+# =========================
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
+PAGE_TTL = int(os.getenv("PAGE_TTL", "300"))
+PAGE_COMMENTS = 50
+
+def _parse_timestamp(value) -> datetime | None:
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+
+def _display_datetime(value) -> str:
+    ts = _parse_timestamp(value)
+    return ts.strftime("%d %b %Y, %H:%M") if ts else ""
+
+templates.env.filters["display_datetime"] = _display_datetime
+
+def _page_cache_key(item_type: str, item_id: int) -> str:
+    # Trailing colon so invalidating story 1 doesn't also drop story 12.
+    return f"page:{item_type}:{item_id}:"
+
+def _invalidate_item_page(item_type: str, item_id):
+    if item_type and item_id is not None:
+        _cache_invalidate(_page_cache_key(item_type, item_id))
+
+def _absolute_url(request: Request, path: str) -> str:
+    if not path or path.startswith(("http://", "https://")):
+        return path
+    base = (SITE_URL or str(request.base_url)).rstrip("/")
+    return base + "/" + path.lstrip("/")
+
+def _render_item_page(request: Request, item_type: str, item_id: int) -> Response:
+    """
+    Render /story/{id} or /blog/{id} with the item, OpenGraph tags and the
+    first page of comments embedded, so a shared link loads in one request.
+    Rendered pages are cached per id and dropped on edit, delete, like or new comment.
+    """
+    key = _page_cache_key(item_type, item_id)
+    variants = _cache_get(key, PAGE_TTL)
+    status_code = 200
+    if variants is None:
+        table = _TYPE_TO_TABLE[item_type]
+        try:
+            rows = db.table(table).select("*").eq("id", item_id).execute().data
+            comments = get_comments(item_type, item_id, limit=PAGE_COMMENTS + 1) if rows else []
+        except Exception as e:
+            logger.error(f"render {item_type} page {item_id}: {e}")
+            raise HTTPException(status_code=500, detail=f"Could not load {item_type}")
+        try:
+            if rows:
+                _ensure_related()
+        except Exception as e:
+            # Still serve the page, just don't cache it without its related section.
+            logger.warning(f"render {item_type} page {item_id}: related index unavailable: {e}")
+
+        item = rows[0] if rows else None
+        published = _parse_timestamp(item.get("created_at")) if item else None
+        html = templates.get_template("story.html").render(
+            item_type=item_type,
+            item=item,
+            published=published.strftime("%d %B %Y") if published else "",
+            comments=comments[:PAGE_COMMENTS],
+            more_comments=len(comments) > PAGE_COMMENTS,
+            related=_related_items(item_type, item_id, 4) if item else [],
+            og={
+                "url": _absolute_url(request, f"/{item_type}/{item_id}"),
+                "image": _absolute_url(request, item.get("image_url")) if item else None,
+                "description": (item.get("excerpt") or _excerpt(item.get("content") or "")) if item else "",
+            },
+            page_data={"item_type": item_type, "id": item["id"] if item else None},
+        )
+        variants = precompress(html.encode("utf-8"))
+        if item is None:
+            status_code = 404
+        elif _related.built_at:
+            _cache_set(key, variants)
+
+    response = precompressed_response(
+        variants, request.headers.get("accept-encoding", ""), media_type="text/html; charset=utf-8",
+    )
+    response.status_code = status_code
+    return response
+
+
 # =========================
 # LIKES
 # =========================
@@ -571,12 +1414,17 @@ def like(item_type: str, item_id: int):
     if not table:
         raise HTTPException(status_code=400, detail=f"Invalid item_type '{item_type}'. Must be quote, story, or blog.")
     try:
-        rows = supabase.table(table).select("id, likes").eq("id", item_id).execute().data
+        rows = db.table(table, coalesce=False).select("id, likes").eq("id", item_id).execute().data
         if not rows:
             raise HTTPException(status_code=404, detail=f"{item_type.capitalize()} #{item_id} not found")
         current = rows[0].get("likes") or 0
         new_val = current + 1
-        supabase.table(table).update({"likes": new_val}).eq("id", item_id).execute()
+        db.table(table).update({"likes": new_val}).eq("id", item_id).execute()
+        _invalidate_item_page(item_type, item_id)
+        if item_type == "quote":
+            _patch_rotation(item_id, likes=new_val)
+        hub.publish("like", {"item_type": item_type, "item_id": item_id, "likes": new_val})
+        _rankings.like(item_type, item_id)
         logger.info(f"Like: {table} id={item_id} → {new_val}")
         return {"likes": new_val}
     except HTTPException:
@@ -586,26 +1434,279 @@ def like(item_type: str, item_id: int):
         raise HTTPException(status_code=500, detail="Could not update likes")
 
 
+# =========================
+# TRENDING / POPULAR
+# =========================
+# Rankings are scored in-process (ranking.py). The boards are built from the
+# database on first use, then moved by like and comment events, and rebuilt
+# in full every RANKING_REBUILD_SECONDS. Only the top-K ids are precomputed;
+# their card rows are fetched with a single `in` query and cached briefly.
+RANKING_REBUILD_SECONDS = float(os.getenv("RANKING_REBUILD_SECONDS", "900"))
+RANKING_TTL = int(os.getenv("RANKING_TTL", "30"))
+
+_rankings = ranking.Rankings()
+_rankings_lock = Lock()
+
+def _rebuild_rankings():
+    items, comments = {}, {}
+    for item_type, table in _TYPE_TO_TABLE.items():
+        columns = "id, likes" if table == "quotes" else "id, likes, created_at"   # quotes are undated
+        rows = db.table(table).select(columns).execute().data or []
+        items[item_type] = (
+            [r["id"] for r in rows],
+            [r.get("likes") or 0 for r in rows],
+            [_epoch(r.get("created_at")) or float("nan") for r in rows],
+        )
+    query = db.table("comments").select("item_type, item_id, created_at")
+    if _has_column("comments", "is_hidden"):
+        query = query.neq("is_hidden", True)
+    for row in query.execute().data or []:
+        ids, times = comments.setdefault(row.get("item_type"), ([], []))
+        ids.append(row.get("item_id"))
+        times.append(_epoch(row.get("created_at")) or float("nan"))
+    _rankings.rebuild(items, comments)
+    logger.info(f"Rankings rebuilt: { {t: len(v[0]) for t, v in items.items()} }")
+
+def _ranked(board: str, item_type: str, limit: int) -> list:
+    table = _TYPE_TO_TABLE.get(item_type)
+    if not table:
+        raise HTTPException(status_code=400, detail=f"Invalid item_type '{item_type}'. Must be quote, story, or blog.")
+    if not _rankings.built_at:
+        with _rankings_lock:
+            if not _rankings.built_at:
+                _rebuild_rankings()
+    top = _rankings.top(board, item_type, max(1, min(limit, ranking.RANKING_TOP_K)))
+    ids = tuple(item_id for item_id, _ in top)
+    key = f"rank:{board}:{item_type}:{len(ids)}"
+    cached = _cache_get(key, RANKING_TTL)
+    if not cached or cached[0] != ids:
+        rows = []
+        if ids:
+            rows = db.table(table).select(_select_columns(table, view="card")).in_("id", list(ids)).execute().data or []
+        cached = (ids, {r["id"]: r for r in rows})
+        _cache_set(key, cached)
+    cards = cached[1]
+    return [{**cards[item_id], "score": round(score, 3)} for item_id, score in top if item_id in cards]
+
+@app.get("/trending/{item_type}")
+def get_trending(item_type: str, limit: int = 10):
+    """Public — most liked/discussed lately; each like or comment counts half as much every TRENDING_HALF_LIFE_HOURS."""
+    try:
+        return _ranked("trending", item_type, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"get_trending {item_type}: {e}")
+        raise HTTPException(500, str(e))
+
+@app.get("/popular/{item_type}")
+def get_popular(item_type: str, limit: int = 10):
+    """Public — most liked/discussed of all time."""
+    try:
+        return _ranked("popular", item_type, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"get_popular {item_type}: {e}")
+        raise HTTPException(500, str(e))
+
+_run_periodically("ranking-rebuild", RANKING_REBUILD_SECONDS, _rebuild_rankings)
+
+
+# =========================
+# MODERATION COUNTERS
+# =========================
+# Running totals behind /admin/comments/stats and /admin/users/stats, so those
+# answer in O(1) instead of pulling every comment/user row. Built from lean
+# selects in the background at startup, then kept current by the endpoints
+# that change them (comment add/hide/restore/delete, registration, ban/unban,
+# role, delete). Rebuilt in the background every COUNTERS_REBUILD_SECONDS to
+# absorb edits made outside the app — a stats request never waits on one.
+COUNTERS_REBUILD_SECONDS = int(os.getenv("COUNTERS_REBUILD_SECONDS", "3600"))
+NEW_USER_WINDOW = 7 * 24 * 3600
+
+_counters: dict = {}
+_recent_signups: deque = deque()   # sign-up times (epoch) within NEW_USER_WINDOW, oldest first
+_counters_built_at = 0.0
+_counters_lock = Lock()
+_counters_rebuild_lock = Lock()
+
+def _epoch(value) -> float | None:
+    ts = _parse_timestamp(value)
+    if ts is None:
+        return None
+    return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).timestamp()
+
+def _comment_buckets(row: dict) -> list:
+    keys = ["comments.total"]
+    if row.get("sentiment") in ("positive", "neutral", "negative"):
+        keys.append(f"comments.{row['sentiment']}")
+    toxicity = row.get("toxicity") or 0
+    if toxicity >= 0.4:
+        keys.append("comments.toxic")
+    if toxicity >= 0.7:
+        keys.append("comments.flagged")
+    if row.get("is_hidden"):
+        keys.append("comments.hidden")
+    return keys
+
+def _user_buckets(row: dict) -> list:
+    keys = ["users.total"]
+    if row.get("is_banned"):
+        keys.append("users.banned")
+    if row.get("role") == "moderator":
+        keys.append("users.moderators")
+    return keys
+
+def _count(keys: list, delta: int = 1):
+    """Apply `delta` to each counter in `keys` (no-op until the first build)."""
+    with _counters_lock:
+        if not _counters_built_at:
+            return
+        for key in keys:
+            _counters[key] = _counters.get(key, 0) + delta
+
+def _count_signup(created_at, delta: int = 1):
+    at = _epoch(created_at) or time.time()
+    with _counters_lock:
+        if not _counters_built_at or at < time.time() - NEW_USER_WINDOW:
+            return
+        if delta > 0:
+            _recent_signups.append(at)
+        elif at in _recent_signups:
+            _recent_signups.remove(at)
+
+def _rebuild_counters():
+    global _counters_built_at
+    comments = db.table("comments").select(_columns("comments", "sentiment", "toxicity", "is_hidden")).execute().data or []
+    users = db.table(USER_TABLE).select("is_banned, role, created_at").execute().data or []
+    counts: dict = defaultdict(int)
+    for row in comments:
+        for key in _comment_buckets(row):
+            counts[key] += 1
+    for row in users:
+        for key in _user_buckets(row):
+            counts[key] += 1
+    cutoff = time.time() - NEW_USER_WINDOW
+    recent = sorted(t for t in (_epoch(r.get("created_at")) for r in users) if t and t >= cutoff)
+    with _counters_lock:
+        _counters.clear()
+        _counters.update(counts)
+        _recent_signups.clear()
+        _recent_signups.extend(recent)
+        _counters_built_at = time.time()
+    logger.info(f"Moderation counters rebuilt from {len(comments)} comments, {len(users)} users")
+
+def _refresh_counters():
+    with _counters_rebuild_lock:
+        _rebuild_counters()
+
+def _moderation_counts() -> dict:
+    if not _counters_built_at:
+        # Only before the startup build has finished (or if it failed).
+        with _counters_rebuild_lock:
+            if not _counters_built_at:
+                _rebuild_counters()
+    with _counters_lock:
+        cutoff = time.time() - NEW_USER_WINDOW
+        while _recent_signups and _recent_signups[0] < cutoff:
+            _recent_signups.popleft()
+        return {**_counters, "users.new_7d": len(_recent_signups)}
+
+_run_periodically("counters-rebuild", COUNTERS_REBUILD_SECONDS, _refresh_counters)
+
+
+# =========================
+# COMMENT COUNTS
+# =========================
+# quotes/stories/blogs.comment_count holds the number of visible comments, so
+# cards can show "12 comments" without fetching them. Kept current by the
+# comment endpoints like `likes` is (read, then write the new value); anything
+# that slips through — a failed bump, two racing writers, rows edited by hand —
+# is corrected by a bulk recount every COMMENT_COUNT_REPAIR_SECONDS.
+#
+# One-time Supabase setup (SQL editor):
+#   alter table quotes  add column if not exists comment_count integer not null default 0;
+#   alter table stories add column if not exists comment_count integer not null default 0;
+#   alter table blogs   add column if not exists comment_count integer not null default 0;
+# then POST /admin/schema/probe and POST /admin/comment-counts/rebuild.
+COMMENT_COUNT_REPAIR_SECONDS = float(os.getenv("COMMENT_COUNT_REPAIR_SECONDS", "3600"))
+
+def _bump_comment_count(item_type: str, item_id, delta: int):
+    """Add `delta` to an item's comment_count. Never fails the calling request."""
+    table = _TYPE_TO_TABLE.get(item_type)
+    if not table or item_id is None or not _has_column(table, "comment_count"):
+        return
+    try:
+        rows = db.table(table, coalesce=False).select("id, comment_count").eq("id", item_id).execute().data
+        if rows:
+            new_val = max((rows[0].get("comment_count") or 0) + delta, 0)
+            db.table(table).update({"comment_count": new_val}).eq("id", item_id).execute()
+            if item_type == "quote":
+                _patch_rotation(item_id, comment_count=new_val)
+    except Exception as e:
+        logger.warning(f"comment_count {item_type}/{item_id} not updated (repair will fix it): {e}")
+
+def _repair_comment_counts() -> dict:
+    """Recount visible comments per item and write back every count that drifted."""
+    query = db.table("comments").select("item_type, item_id")
+    if _has_column("comments", "is_hidden"):
+        query = query.neq("is_hidden", True)
+    counts: dict = defaultdict(int)
+    for row in query.execute().data or []:
+        counts[(row.get("item_type"), row.get("item_id"))] += 1
+
+    fixed = {}
+    for item_type, table in _TYPE_TO_TABLE.items():
+        if not _has_column(table, "comment_count"):
+            continue
+        fixed[table] = 0
+        for row in db.table(table).select("id, comment_count").execute().data or []:
+            actual = counts.get((item_type, row["id"]), 0)
+            if (row.get("comment_count") or 0) != actual:
+                db.table(table).update({"comment_count": actual}).eq("id", row["id"]).execute()
+                fixed[table] += 1
+    if any(fixed.values()):
+        _cache_invalidate("bootstrap")
+        logger.info(f"comment_count repaired: {fixed}")
+    return fixed
+
+def _comment_visibility(row: dict, delta: int):
+    """A comment appeared in (+1) or left (-1) public view."""
+    _bump_comment_count(row.get("item_type"), row.get("item_id"), delta)
+    _rankings.comment(row.get("item_type"), row.get("item_id"), _epoch(row.get("created_at")), delta)
+
+_run_periodically("comment-count-repair", COMMENT_COUNT_REPAIR_SECONDS, _repair_comment_counts)
+
+@app.post("/admin/comment-counts/rebuild")
+def rebuild_comment_counts(username: str = Depends(require_admin)):
+    """Admin — recount comment_count on every quote, story and blog now."""
+    if not any(_has_column(t, "comment_count") for t in _TYPE_TO_TABLE.values()):
+        raise HTTPException(status_code=400, detail="comment_count column missing — run the migration, then POST /admin/schema/probe")
+    try:
+        fixed = _repair_comment_counts()
+    except Exception as e:
+        logger.error(f"rebuild_comment_counts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"Admin '{username}' rebuilt comment counts: {fixed}")
+    return {"success": True, "updated": fixed}
+
+
 # =========================
 # COMMENTS
 # =========================
 @app.get("/comments/{item_type}/{item_id}")
-def get_comments(item_type: str, item_id: int):
-    """Public — returns non-hidden comments only."""
-    try:
-        return (supabase.table("comments")
-                .select("*")
-                .eq("item_type", item_type)
-                .eq("item_id", item_id)
-                .neq("is_hidden", True)
-                .execute().data)
-    except Exception:
-        # Fallback if is_hidden column doesn't exist yet
-        return supabase.table("comments")\
-            .select("*")\
-            .eq("item_type", item_type)\
-            .eq("item_id", item_id)\
-            .execute().data
+def get_comments(item_type: str, item_id: int, limit: int = None, offset: int = 0):
+    """Public — returns non-hidden comments only, oldest first when paginated."""
+    query = (db.table("comments")
+             .select("*")
+             .eq("item_type", item_type)
+             .eq("item_id", item_id))
+    if _has_column("comments", "is_hidden"):
+        query = query.neq("is_hidden", True)
+    if limit:
+        query = query.order("id").range(offset, offset + limit - 1)
+    return query.execute().data
 
 
 # ── SENTIMENT & TOXICITY HELPERS ──
@@ -633,6 +1734,15 @@ def _toxicity(text: str) -> float:
     return 0.0
 
 
+def _publish_comment(event: str, row: dict):
+    """Push a comment delta to live clients — only the fields cards render."""
+    if event == "comment.remove":
+        data = {k: row.get(k) for k in ("id", "item_type", "item_id")}
+    else:
+        data = {k: row.get(k) for k in ("id", "item_type", "item_id", "username", "content", "sentiment", "created_at")}
+    hub.publish(event, data)
+
+
 @app.post("/comments")
 def add_comment(data: dict, request: Request, authorization: str = Header(None)):
     """
@@ -668,32 +1778,21 @@ def add_comment(data: dict, request: Request, authorization: str = Header(None))
         "item_id":   int(item_id),
         "sentiment": _sentiment(text),
     }
+    if _has_column("comments", "toxicity"):
+        payload["toxicity"] = _toxicity(text)
 
-    # Attempt 1: include toxicity score
-    try:
-        res = supabase.table("comments").insert({**payload, "toxicity": _toxicity(text)}).execute()
-        if res.data:
-            logger.info(f"Comment saved by user '{user['username']}' (with toxicity) id={res.data[0].get('id')}")
-            return res.data
-    except Exception as e:
-        err = str(e).lower()
-        if any(kw in err for kw in ["toxicity", "column", "schema", "undefined", "does not exist", "not found"]):
-            logger.warning(f"toxicity column missing, retrying without it ({e})")
-        else:
-            logger.error(f"add_comment error: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to save comment: {e}")
-
-    # Attempt 2: without toxicity
     try:
-        res = supabase.table("comments").insert(payload).execute()
+        res = db.table("comments").insert(payload).execute()
         if res.data:
-            logger.info(f"Comment saved by user '{user['username']}' (no toxicity)")
+            logger.info(f"Comment saved by user '{user['username']}' id={res.data[0].get('id')}")
+            _count(_comment_buckets(res.data[0]))
+            _comment_visibility(res.data[0], 1)
+            _invalidate_item_page(item_type, int(item_id))
+            _publish_comment("comment.add", res.data[0])
             return res.data
         raise ValueError("Supabase returned empty data")
-    except HTTPException:
-        raise
     except Exception as e:
-        logger.error(f"add_comment retry error: {e}")
+        logger.error(f"add_comment error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to save comment: {e}")
 
 
@@ -701,7 +1800,13 @@ def add_comment(data: dict, request: Request, authorization: str = Header(None))
 def delete_comment(comment_id: int, username: str = Depends(require_admin)):
     """Delete a comment by ID. Requires admin Authorization header."""
     try:
-        supabase.table("comments").delete().eq("id", comment_id).execute()
+        res = db.table("comments").delete().eq("id", comment_id).execute()
+        for row in res.data or []:
+            _count(_comment_buckets(row), -1)
+            if not row.get("is_hidden"):
+                _comment_visibility(row, -1)
+            _invalidate_item_page(row.get("item_type"), row.get("item_id"))
+            _publish_comment("comment.remove", row)
         logger.info(f"Admin '{username}' deleted comment {comment_id}")
         return {"message": "Comment deleted", "id": comment_id}
     except Exception as e:
@@ -712,9 +1817,92 @@ def delete_comment(comment_id: int, username: str = Depends(require_admin)):
 # =========================
 # FORUM
 # =========================
+# Posts are threaded one level deep: a reply points at its top-level post via
+# parent_id, and each top-level post carries a maintained reply_count. Pages
+# of threads and pages of one thread's replies are both single indexed range
+# queries on (parent_id, id), so a forum page costs the same however many
+# posts the table holds.
+#
+# One-time Supabase setup (SQL editor):
+#   alter table forumpost add column if not exists parent_id bigint references forumpost(id) on delete cascade;
+#   alter table forumpost add column if not exists reply_count integer not null default 0;
+#   create index if not exists ix_forumpost_parent on forumpost (parent_id, id);
+# then POST /admin/schema/probe. Old "@name — " replies stay top-level posts.
+FORUM_PAGE_MAX = 100
+
+def _forum_threaded() -> bool:
+    return _has_column("forumpost", "parent_id") and _has_column("forumpost", "reply_count")
+
+def _bump_reply_count(post_id: int, delta: int):
+    """Add `delta` to a thread's reply_count. Never fails the calling request."""
+    try:
+        rows = db.table("forumpost", coalesce=False).select("id, reply_count").eq("id", post_id).execute().data
+        if rows:
+            new_val = max((rows[0].get("reply_count") or 0) + delta, 0)
+            db.table("forumpost").update({"reply_count": new_val}).eq("id", post_id).execute()
+            hub.publish("forum.update", {"id": post_id, "reply_count": new_val})
+    except Exception as e:
+        logger.warning(f"reply_count of forum post {post_id} not updated: {e}")
+
+def _forum_thread_root(post_id) -> int:
+    """Id of the top-level post to file a reply under (replies to replies join the same thread)."""
+    try:
+        post_id = int(post_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="parent_id must be a post id")
+    rows = db.table("forumpost").select("id, parent_id").eq("id", post_id).execute().data
+    if not rows:
+        raise HTTPException(status_code=404, detail="Original post not found")
+    return rows[0].get("parent_id") or rows[0]["id"]
+
+def _publish_forum_insert(row: dict):
+    if row.get("parent_id"):
+        hub.publish("forum.reply", row)
+    else:
+        hub.publish("forum.post", row)
+
 @app.get("/forum/posts")
-def get_posts():
-    return supabase.table("forumpost").select("*").execute().data
+def get_posts(response: Response = None, limit: int = None, offset: int = 0):
+    def fetch():
+        query = db.table("forumpost").select("*")
+        if limit:
+            query = query.order("id", desc=True).range(offset, offset + limit - 1)
+        return query.execute().data
+
+    return _last_good(f"forum:{limit}:{offset}", fetch, response)
+
+
+@app.get("/forum/threads")
+def get_threads(response: Response = None, limit: int = 20, offset: int = 0):
+    """Public — a page of top-level posts, newest first, each with its reply_count."""
+    limit = max(1, min(limit, FORUM_PAGE_MAX))
+    threaded = _forum_threaded()
+
+    def fetch():
+        query = db.table("forumpost").select("*")
+        if threaded:
+            query = query.is_("parent_id", "null")
+        rows = query.order("id", desc=True).range(offset, offset + limit - 1).execute().data or []
+        return rows if threaded else [{**r, "reply_count": 0} for r in rows]
+
+    return _last_good(f"threads:{limit}:{offset}", fetch, response)
+
+
+@app.get("/forum/threads/{post_id}/replies")
+def get_thread_replies(post_id: int, response: Response = None, limit: int = 50, offset: int = 0):
+    """Public — replies to one top-level post, oldest first. Loaded when a thread is opened."""
+    limit = max(1, min(limit, FORUM_PAGE_MAX))
+    if not _forum_threaded():
+        return []
+
+    def fetch():
+        return (db.table("forumpost").select("*")
+                .eq("parent_id", post_id)
+                .order("id")
+                .range(offset, offset + limit - 1)
+                .execute().data or [])
+
+    return _last_good(f"replies:{post_id}:{limit}:{offset}", fetch, response)
 
 
 @app.post("/forum/post")
@@ -739,10 +1927,18 @@ def create_post(data: dict, request: Request, authorization: str = Header(None))
 
     # name comes from the authenticated user's username
     payload = {"name": user["username"], "message": message}
+    parent_id = None
+    if data.get("parent_id") is not None and _forum_threaded():
+        parent_id = payload["parent_id"] = _forum_thread_root(data["parent_id"])
 
     try:
-        res = supabase.table("forumpost").insert(payload).execute()
-        logger.info(f"Forum post created by user '{user['username']}'")
+        res = db.table("forumpost").insert(payload).execute()
+        logger.info(f"Forum post created by user '{user['username']}'" + (f" in thread {parent_id}" if parent_id else ""))
+        _cache_invalidate("bootstrap")
+        if parent_id and res.data:
+            _bump_reply_count(parent_id, 1)
+        for row in res.data or []:
+            _publish_forum_insert(row)
         return res.data
     except Exception as e:
         logger.error(f"forum post insert error: {e}")
@@ -760,9 +1956,11 @@ def update_forum_post(post_id: int, data: dict, username: str = Depends(require_
     if name:    payload["name"]    = name
     if message: payload["message"] = message
     try:
-        res = supabase.table("forumpost").update(payload).eq("id", post_id).execute()
+        res = db.table("forumpost").update(payload).eq("id", post_id).execute()
+        _cache_invalidate("bootstrap")
         if not res.data:
             raise HTTPException(status_code=404, detail="Forum post not found")
+        hub.publish("forum.update", res.data[0])
         logger.info(f"Forum post {post_id} updated by admin '{username}'")
         return res.data[0]
     except HTTPException:
@@ -776,7 +1974,20 @@ def update_forum_post(post_id: int, data: dict, username: str = Depends(require_
 def delete_forum_post(post_id: int, username: str = Depends(require_admin)):
     """Delete a forum post by ID. Requires admin auth."""
     try:
-        supabase.table("forumpost").delete().eq("id", post_id).execute()
+        threaded = _forum_threaded()
+        replies = []
+        if threaded:
+            # Replies first — the parent_id foreign key won't let the root go while
+            # they exist (Postgres cascades; SQLite needs it done by hand).
+            replies = db.table("forumpost").delete().eq("parent_id", post_id).execute().data or []
+        res = db.table("forumpost").delete().eq("id", post_id).execute()
+        if threaded:
+            for row in res.data or []:
+                if row.get("parent_id"):
+                    _bump_reply_count(row["parent_id"], -1)
+        _cache_invalidate("bootstrap")
+        for row in replies + (res.data or []):
+            hub.publish("forum.remove", {"id": row["id"]})
         logger.info(f"Forum post {post_id} deleted by admin '{username}'")
         return {"message": "Forum post deleted", "id": post_id}
     except Exception as e:
@@ -786,20 +1997,29 @@ def delete_forum_post(post_id: int, username: str = Depends(require_admin)):
 
 @app.post("/forum/posts/{post_id}/reply")
 def reply_to_forum_post(post_id: int, data: dict, username: str = Depends(require_admin)):
-    """Admin reply to a forum post — stored as a new forum post with @mention prefix."""
+    """Admin reply to a forum post — filed in the post's thread (pre-migration: a new post with @mention prefix)."""
     message = (data.get("message") or "").strip()
     if not message:
         raise HTTPException(status_code=400, detail="Reply message is required")
-    # Check original post exists
-    original = supabase.table("forumpost").select("id, name").eq("id", post_id).execute()
-    if not original.data:
-        raise HTTPException(status_code=404, detail="Original post not found")
-    original_name = original.data[0].get("name", "User")
-    reply_message = f"@{original_name} — {message}"
-    payload = {"name": f"Admin ({username})", "message": reply_message}
+    if _forum_threaded():
+        parent_id = _forum_thread_root(post_id)
+        payload = {"name": f"Admin ({username})", "message": message, "parent_id": parent_id}
+    else:
+        # Check original post exists
+        original = db.table("forumpost").select("id, name").eq("id", post_id).execute()
+        if not original.data:
+            raise HTTPException(status_code=404, detail="Original post not found")
+        original_name = original.data[0].get("name", "User")
+        parent_id = None
+        payload = {"name": f"Admin ({username})", "message": f"@{original_name} — {message}"}
     try:
-        res = supabase.table("forumpost").insert(payload).execute()
+        res = db.table("forumpost").insert(payload).execute()
         logger.info(f"Admin '{username}' replied to forum post {post_id}")
+        _cache_invalidate("bootstrap")
+        if parent_id and res.data:
+            _bump_reply_count(parent_id, 1)
+        for row in res.data or []:
+            _publish_forum_insert(row)
         return res.data[0] if res.data else {"message": "Reply posted"}
     except Exception as e:
         logger.error(f"reply_to_forum_post {post_id}: {e}")
@@ -820,17 +2040,177 @@ def contact(data: dict, request: Request):
     if "@" not in email or "." not in email:
         raise HTTPException(status_code=400, detail="Invalid email address")
     try:
-        return supabase.table("contactmessage").insert({
-            "name": name, "email": email, "message": message
-        }).execute().data
+        write_queue.insert("contactmessage", {"name": name, "email": email, "message": message})
+        return {"success": True}
     except Exception as e:
         logger.error(f"contact/send: {e}")
         raise HTTPException(status_code=500, detail="Failed to send message. Please try again.")
 
 
+# =========================
+# HOMEPAGE BOOTSTRAP
+# =========================
+# Page sizes mirror the first request each index.html loader would make.
+BOOTSTRAP_TTL = int(os.getenv("BOOTSTRAP_TTL", "30"))
+BOOTSTRAP_QUOTES = 100
+BOOTSTRAP_STORIES = 25
+BOOTSTRAP_BLOGS = 6
+BOOTSTRAP_POSTS = 50
+
+# The carousels and the forum page in past their first page, so the
+# about-section stats come from real totals instead of however many items have
+# loaded so far. Forum posts count threads and replies alike.
+_COUNTED_TABLES = {"quotes": "quotes", "stories": "stories", "blogs": "blogs", "posts": "forumpost"}
+
+@app.get("/counts")
+def get_counts(response: Response = None):
+    """Public — total quotes, stories, blogs and forum posts, for the homepage stats."""
+    def fetch():
+        return {name: db.table(table).select("id", count="exact").limit(1).execute().count or 0
+                for name, table in _COUNTED_TABLES.items()}
+
+    return _last_good("counts", fetch, response)
+
+# (document key, loader, kwargs) — shared by the endpoint and the snapshot refresher
+_BOOTSTRAP_PARTS = (
+    ("settings", settings_alias, {}),
+    ("counts",   get_counts,     {}),
+    ("quotes",   get_quotes,     {"view": "card", "limit": BOOTSTRAP_QUOTES}),
+    ("stories",  get_stories,    {"view": "card", "limit": BOOTSTRAP_STORIES}),
+    ("blogs",    get_blogs,      {"view": "card", "limit": BOOTSTRAP_BLOGS}),
+    ("posts",    get_threads,    {"limit": BOOTSTRAP_POSTS}),
+)
+
+@app.get("/bootstrap")
+async def bootstrap(request: Request):
+    """
+    Public — everything the homepage needs for first paint in one response:
+    settings, content totals, and the first page of quotes, stories, blogs and
+    forum posts. The six queries run concurrently; the encoded document is
+    cached for BOOTSTRAP_TTL seconds and dropped whenever an admin edits content.
+    """
+    variants = _cache_get("bootstrap", BOOTSTRAP_TTL)
+    if variants is None:
+        try:
+            results = await asyncio.gather(
+                *(run_in_threadpool(loader, **kwargs) for _, loader, kwargs in _BOOTSTRAP_PARTS)
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"bootstrap: {e}")
+            raise HTTPException(status_code=500, detail="Could not load homepage data")
+        variants = precompress(dumps({name: data for (name, _, _), data in zip(_BOOTSTRAP_PARTS, results)}))
+        _cache_set("bootstrap", variants)
+    return precompressed_response(
+        variants,
+        request.headers.get("accept-encoding", ""),
+        headers={"Cache-Control": f"public, max-age={BOOTSTRAP_TTL}"},
+    )
+
+
+# =========================
+# CONTENT SNAPSHOT
+# =========================
+# Warm start: load the last snapshot before serving, then revalidate from
+# upstream in the background and re-save every SNAPSHOT_INTERVAL (snapshot.py).
+# Both are run by the lifespan hook (see APP), not on import.
+def _refresh_snapshot():
+    """Rebuild the homepage document from upstream and persist it with the last-known-good reads."""
+    global _related_from_snapshot
+    payload = {name: loader(**kwargs) for name, loader, kwargs in _BOOTSTRAP_PARTS}
+    _cache_set("bootstrap", precompress(dumps(payload)))
+    if _related_from_snapshot:
+        _rebuild_related()
+        _related_from_snapshot = False
+    with _stale_lock:
+        entries = dict(_stale_store)
+    doc = {"bootstrap": payload, "entries": entries}
+    if _related.built_at:
+        doc["related"] = _related.documents()
+    snapshot.save(doc)
+
+def _warm_from_snapshot():
+    global _related_from_snapshot
+    doc = snapshot.load()
+    if not doc:
+        return
+    entries = doc.get("entries") or {}
+    with _stale_lock:
+        for key, (saved_at, data) in entries.items():
+            _stale_store.setdefault(key, (saved_at, data))
+    if doc.get("bootstrap"):
+        _cache_set("bootstrap", precompress(dumps(doc["bootstrap"])))
+    if doc.get("related"):
+        _related.build([((t, i), title, body, card) for t, i, title, body, card in doc["related"]])
+        _related_from_snapshot = True
+    logger.info(f"Caches warmed from snapshot saved {int(time.time() - doc['saved_at'])}s ago "
+                f"({len(entries)} content entries)")
+
+# =========================
+# LIVE EVENTS (SSE)
+# =========================
+@app.get("/events")
+async def live_events(request: Request, last_event_id: str = Header(None)):
+    """
+    Public — Server-Sent Events stream of small deltas:
+      like            {item_type, item_id, likes}
+      comment.add     {id, item_type, item_id, username, content, sentiment, created_at}
+      comment.remove  {id, item_type, item_id}
+      forum.post      new top-level forum post row
+      forum.reply     new reply row (has parent_id)
+      forum.update    forum post row, or {id, reply_count}
+      forum.remove    {id}
+      resync          client fell behind — reload from /bootstrap
+    Reconnecting clients send Last-Event-ID and get what they missed replayed.
+    """
+    return StreamingResponse(
+        hub.stream(request, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # =========================
 # CHATBOT
 # =========================
+# A content question names its topic after one of these phrases: "stories
+# about grief", "anything on business", "find healing". Bare keywords
+# ("give me a quote") are left to the canned intents below.
+_CHAT_TOPIC = re.compile(
+    r"\b(?:about|regarding|find|search(?:ing)? for|looking for"
+    r"|(?:anything|something|stor(?:y|ies)|blogs?|articles?|quotes?|posts?) on)\s+(.+)")
+_CHAT_TYPE_WORDS = {"story": "story", "stories": "story", "blog": "blog", "blogs": "blog",
+                    "article": "blog", "articles": "blog", "quote": "quote", "quotes": "quote"}
+# Topics that are really questions about the site, answered by the canned replies.
+_CHAT_SITE_WORDS = {"quoteme", "site", "website", "mission", "vision", "founder", "team", "forum",
+                    "donate", "donation", "contact", "instagram", "admin", "dark", "mode", "theme"}
+_CHAT_HELP_WORDS = ("help", "what can you do", "commands", "menu", "options", "what do you do")
+CHAT_SEARCH_MIN_SCORE = float(os.getenv("CHAT_SEARCH_MIN_SCORE", "0.1"))
+
+def _chat_search(msg: str) -> str | None:
+    """Chatbot reply listing the best-matching content, or None if this isn't a content question."""
+    match = _CHAT_TOPIC.search(msg)
+    if not match or not _related.built_at:
+        return None
+    topic = [t for t in related.tokenize(match.group(1)) if t not in _CHAT_TYPE_WORDS]
+    if not topic or set(topic) <= _CHAT_SITE_WORDS:
+        return None
+    words = set(re.findall(r"[a-z]+", msg[:match.start(1)]))
+    types = {_CHAT_TYPE_WORDS[w] for w in words if w in _CHAT_TYPE_WORDS}
+    hits = _related.search(" ".join(topic), limit=3, item_type=types.pop() if len(types) == 1 else None)
+    hits = [h for h in hits if h[1] >= CHAT_SEARCH_MIN_SCORE]
+    if not hits:
+        return None
+    lines = []
+    for card, _, snip in hits:
+        if card["item_type"] == "quote":
+            lines.append(f"💬 \"{card['text']}\"\n   — {card.get('author') or 'QuoteMe ZW'}")
+        else:
+            icon = "📖" if card["item_type"] == "story" else "📝"
+            lines.append(f"{icon} *{card['title']}*\n{snip}\n👉 /{card['item_type']}/{card['id']}")
+    return f"Here's what I found on \"{' '.join(topic)}\" 🔎\n\n" + "\n\n".join(lines)
+
 @app.post("/chatbot")
 def chatbot(data: dict, request: Request):
     """
@@ -845,29 +2225,42 @@ def chatbot(data: dict, request: Request):
     if not msg:
         return {"reply": "Please type a message 😊 Try saying 'help' to see what I can do!"}
 
+    try:
+        _ensure_related()
+    except Exception as e:
+        logger.warning(f"chatbot: content index unavailable: {e}")
+
     # ── helpers ──
+    # Served from the content index when it's loaded; straight from the DB otherwise.
     def _quotes(limit=3):
+        if _related.built_at:
+            return _related.items("quote", limit)
         try:
-            return supabase.table("quotes").select("*").limit(limit).execute().data or []
+            return db.table("quotes").select("id, text, author").limit(limit).execute().data or []
         except Exception:
             return []
 
     def _stories(limit=2):
+        if _related.built_at:
+            return _related.items("story", limit)
         try:
-            return supabase.table("stories").select("*").limit(limit).execute().data or []
+            return db.table("stories").select(_columns("stories", "id", "title", "excerpt")).limit(limit).execute().data or []
         except Exception:
             return []
 
     def _blogs(limit=2):
+        if _related.built_at:
+            return _related.items("blog", limit)
         try:
-            return supabase.table("blogs").select("*").limit(limit).execute().data or []
+            return db.table("blogs").select(_columns("blogs", "id", "title", "excerpt")).limit(limit).execute().data or []
         except Exception:
             return []
 
     # =========================
     # GREETINGS
     # =========================
-    if any(w in msg for w in ["hi", "hello", "hey", "good morning", "good afternoon", "good evening", "howdy", "greetings", "sup", "hola"]):
+    # Whole words only — "hi" must not match "anything" or "this".
+    if re.search(r"\b(?:hi|hello|hey|good morning|good afternoon|good evening|howdy|greetings|sup|hola)\b", msg):
         import random
         greets = [
             "Hey there 👋 Welcome to QuoteMe ZW 💖 I'm here to inspire you! Ask me about quotes, stories, blogs, or anything else.",
@@ -896,40 +2289,57 @@ def chatbot(data: dict, request: Request):
         return {"reply": "I'm doing amazing, thank you for asking! 💖 I'm always energised when helping people find inspiration. How are YOU doing today? 😊"}
 
     # =========================
-    # QUOTES
-    # =========================
-    if any(w in msg for w in ["quote", "quotes", "inspire me", "motivation", "motivate", "inspire", "uplift"]):
-        rows = _quotes(3)
-        if rows:
-            sample = "\n\n".join([f"💬 \"{q['text']}\"\'\n   — {q.get('author','Unknown')}" for q in rows])
-            return {"reply": f"Here are some inspiring quotes just for you ✨\n\n{sample}\n\nVisit our Quotes section for more! 💖"}
-        return {"reply": "We post daily inspirational quotes! ✨ Check out our Quotes section on the homepage."}
-
-    # =========================
-    # RANDOM QUOTE
+    # QUOTE OF THE DAY
     # =========================
+    # Checked before QUOTES, which would otherwise catch "quote of the day".
     if any(w in msg for w in ["random quote", "surprise me", "give me a quote", "quote of the day", "qotd"]):
         import random
-        rows = _quotes(10)
+        pick = any(w in msg for w in ["random quote", "surprise me"])
+        try:
+            rows = _quote_rotation()["quotes"]
+        except Exception:
+            rows = []
         if rows:
-            q = random.choice(rows)
-            return {"reply": f"Here's one for you today ✨\n\n💬 \"{q['text']}\"\'\n— {q.get('author','QuoteMe ZW')}"}
+            # "random" / "surprise" pick anything but today's quote
+            q = random.choice(rows[1:]) if pick and len(rows) > 1 else rows[0]
+            return {"reply": f"Here's one for you{'' if pick else ' today'} ✨\n\n💬 \"{q['text']}\"\'\n— {q.get('author') or 'QuoteMe ZW'}"}
         local = [
             "She believed she could, so she did. 🌸",
             "Your potential is endless. Keep going! 💪",
             "Queens don't compete — they collaborate. 👑",
             "The most powerful thing you can do is believe in yourself. ✨",
         ]
-        import random
         return {"reply": "💬 " + random.choice(local)}
 
+    # =========================
+    # CONTENT SEARCH
+    # =========================
+    # "stories about entrepreneurship", "anything on grief?" — answered from
+    # the content index with the best matches and a snippet of each. Runs
+    # after the intents above and never for a request for help; anything it
+    # doesn't answer falls through to the canned replies below.
+    if not any(w in msg for w in _CHAT_HELP_WORDS):
+        reply = _chat_search(msg)
+        if reply:
+            return {"reply": reply}
+
+    # =========================
+    # QUOTES
+    # =========================
+    if any(w in msg for w in ["quote", "quotes", "inspire me", "motivation", "motivate", "inspire", "uplift"]):
+        rows = _quotes(3)
+        if rows:
+            sample = "\n\n".join([f"💬 \"{q['text']}\"\'\n   — {q.get('author','Unknown')}" for q in rows])
+            return {"reply": f"Here are some inspiring quotes just for you ✨\n\n{sample}\n\nVisit our Quotes section for more! 💖"}
+        return {"reply": "We post daily inspirational quotes! ✨ Check out our Quotes section on the homepage."}
+
     # =========================
     # STORIES
     # =========================
     if any(w in msg for w in ["story", "stories", "empowerment", "women", "real stories", "success story"]):
         rows = _stories(2)
         if rows:
-            sample = "\n\n".join([f"📖 *{s['title']}*\n{s['content'][:100]}..." for s in rows])
+            sample = "\n\n".join([f"📖 *{s['title']}*\n{(s.get('excerpt') or '')[:100]}..." for s in rows])
             return {"reply": f"Here are some powerful empowerment stories 💖\n\n{sample}\n\nClick \'Read More\' on any story for the full version!"}
         return {"reply": "We share real women empowerment stories! 💖 Check the Stories section on our homepage."}
 
@@ -939,7 +2349,7 @@ def chatbot(data: dict, request: Request):
     if any(w in msg for w in ["blog", "blogs", "article", "read", "post", "posts"]):
         rows = _blogs(2)
         if rows:
-            sample = "\n\n".join([f"📰 *{b['title']}*\n{b['content'][:100]}..." for b in rows])
+            sample = "\n\n".join([f"📰 *{b['title']}*\n{(b.get('excerpt') or '')[:100]}..." for b in rows])
             return {"reply": f"Here are some of our latest blogs 🚀\n\n{sample}\n\nHead to our Blog section for more!"}
         return {"reply": "Check our Blog section for motivational articles and tips! 🚀"}
 
@@ -1092,7 +2502,7 @@ def chatbot(data: dict, request: Request):
     # =========================
     # HELP / COMMANDS
     # =========================
-    if any(w in msg for w in ["help", "what can you do", "commands", "menu", "options", "what do you do"]):
+    if any(w in msg for w in _CHAT_HELP_WORDS):
         return {
             "reply": (
                 "Here's everything I can help you with! 💖\n\n"
@@ -1159,8 +2569,8 @@ def user_register(data: dict, request: Request):
 
     # Check uniqueness
     try:
-        existing_user  = supabase.table(USER_TABLE).select("id").eq("username", username).execute().data
-        existing_email = supabase.table(USER_TABLE).select("id").eq("email", email).execute().data
+        existing_user  = db.table(USER_TABLE).select("id").eq("username", username).execute().data
+        existing_email = db.table(USER_TABLE).select("id").eq("email", email).execute().data
     except Exception as e:
         logger.error(f"user_register check: {e}")
         raise HTTPException(status_code=500, detail="Could not verify account details. Please try again.")
@@ -1173,7 +2583,7 @@ def user_register(data: dict, request: Request):
     # Hash password and create user
     hashed = pwd_context.hash(password)
     try:
-        res = supabase.table(USER_TABLE).insert({
+        res = db.table(USER_TABLE).insert({
             "username":      username,
             "email":         email,
             "password_hash": hashed,
@@ -1183,6 +2593,8 @@ def user_register(data: dict, request: Request):
             raise ValueError("Empty response from Supabase")
         user = res.data[0]
         token = _make_user_token(user)
+        _count(_user_buckets(user))
+        _count_signup(user.get("created_at"))
         logger.info(f"New site user registered: '{username}' ({email})")
         return {
             "success":  True,
@@ -1213,7 +2625,7 @@ def user_login(data: dict, request: Request):
         raise HTTPException(status_code=400, detail="Email and password are required.")
 
     try:
-        res = supabase.table(USER_TABLE).select("*").eq("email", email).execute()
+        res = db.table(USER_TABLE).select("*").eq("email", email).execute()
     except Exception as e:
         logger.error(f"user_login lookup: {e}")
         raise HTTPException(status_code=500, detail="Login failed. Please try again.")
@@ -1240,7 +2652,7 @@ def user_login(data: dict, request: Request):
 
     # Update last_seen
     try:
-        supabase.table(USER_TABLE).update({"last_seen": datetime.utcnow().isoformat()}).eq("id", user["id"]).execute()
+        write_queue.update(USER_TABLE, {"last_seen": datetime.utcnow().isoformat()}, id=user["id"])
     except Exception:
         pass  # non-fatal
 
@@ -1271,7 +2683,7 @@ def user_me(authorization: str = Header(...)):
 def admin_list_users(username: str = Depends(require_admin), search: str = None):
     """Admin — list all registered site users."""
     try:
-        res = supabase.table(USER_TABLE).select("id, username, email, is_banned, ban_reason, created_at, last_seen").order("id", desc=True).execute()
+        res = db.table(USER_TABLE).select("id, username, email, is_banned, ban_reason, created_at, last_seen").order("id", desc=True).execute()
         rows = res.data or []
         if search:
             s = search.lower().strip()
@@ -1288,9 +2700,12 @@ def admin_ban_user(user_id: int, data: dict = None, username: str = Depends(requ
     data = data or {}
     reason = _strip_html((data.get("reason") or "Account suspended by admin"))[:300]
     try:
-        res = supabase.table(USER_TABLE).update({"is_banned": 1, "ban_reason": reason}).eq("id", user_id).execute()
+        before = db.table(USER_TABLE).select("id, is_banned").eq("id", user_id).execute().data
+        res = db.table(USER_TABLE).update({"is_banned": 1, "ban_reason": reason}).eq("id", user_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="User not found")
+        if before and not before[0].get("is_banned"):
+            _count(["users.banned"])
         logger.info(f"Admin '{username}' banned user {user_id}: {reason}")
         return {"success": True, "user_id": user_id, "banned": True}
     except HTTPException:
@@ -1304,9 +2719,12 @@ def admin_ban_user(user_id: int, data: dict = None, username: str = Depends(requ
 def admin_unban_user(user_id: int, username: str = Depends(require_admin)):
     """Admin — lift a ban on a site user."""
     try:
-        res = supabase.table(USER_TABLE).update({"is_banned": 0, "ban_reason": None}).eq("id", user_id).execute()
+        before = db.table(USER_TABLE).select("id, is_banned").eq("id", user_id).execute().data
+        res = db.table(USER_TABLE).update({"is_banned": 0, "ban_reason": None}).eq("id", user_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="User not found")
+        if before and before[0].get("is_banned"):
+            _count(["users.banned"], -1)
         logger.info(f"Admin '{username}' unbanned user {user_id}")
         return {"success": True, "user_id": user_id, "banned": False}
     except HTTPException:
@@ -1320,7 +2738,10 @@ def admin_unban_user(user_id: int, username: str = Depends(require_admin)):
 def admin_delete_user(user_id: int, username: str = Depends(require_admin)):
     """Admin — permanently delete a site user account."""
     try:
-        supabase.table(USER_TABLE).delete().eq("id", user_id).execute()
+        res = db.table(USER_TABLE).delete().eq("id", user_id).execute()
+        for row in res.data or []:
+            _count(_user_buckets(row), -1)
+            _count_signup(row.get("created_at"), -1)
         logger.info(f"Admin '{username}' deleted user {user_id}")
         return {"success": True, "user_id": user_id}
     except Exception as e:
@@ -1350,7 +2771,7 @@ def user_change_password(data: dict, authorization: str = Header(...)):
         raise HTTPException(status_code=400, detail="New password must be at least 6 characters.")
 
     try:
-        row = supabase.table(USER_TABLE).select("password_hash").eq("id", user["id"]).execute()
+        row = db.table(USER_TABLE).select("password_hash").eq("id", user["id"]).execute()
     except Exception as e:
         raise HTTPException(status_code=500, detail="Could not verify credentials.")
 
@@ -1360,7 +2781,7 @@ def user_change_password(data: dict, authorization: str = Header(...)):
         raise HTTPException(status_code=401, detail="Current password is incorrect.")
 
     hashed = pwd_context.hash(new_pw[:72])
-    supabase.table(USER_TABLE).update({"password_hash": hashed}).eq("id", user["id"]).execute()
+    db.table(USER_TABLE).update({"password_hash": hashed}).eq("id", user["id"]).execute()
     logger.info(f"User '{user['username']}' changed their password")
     return {"success": True}
 
@@ -1373,7 +2794,7 @@ def admin_reset_password(user_id: int, data: dict, username: str = Depends(requi
         raise HTTPException(status_code=400, detail="New password must be at least 6 characters.")
     hashed = pwd_context.hash(new_pw[:72])
     try:
-        res = supabase.table(USER_TABLE).update({"password_hash": hashed}).eq("id", user_id).execute()
+        res = db.table(USER_TABLE).update({"password_hash": hashed}).eq("id", user_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="User not found")
         logger.info(f"Admin '{username}' reset password for user {user_id}")
@@ -1391,9 +2812,13 @@ def admin_promote_user(user_id: int, data: dict, username: str = Depends(require
     if role not in ("user", "moderator", "admin"):
         raise HTTPException(status_code=400, detail="Role must be 'user', 'moderator', or 'admin'.")
     try:
-        res = supabase.table(USER_TABLE).update({"role": role}).eq("id", user_id).execute()
+        before = db.table(USER_TABLE).select("id, role").eq("id", user_id).execute().data
+        res = db.table(USER_TABLE).update({"role": role}).eq("id", user_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="User not found")
+        was_mod = bool(before) and before[0].get("role") == "moderator"
+        if was_mod != (role == "moderator"):
+            _count(["users.moderators"], 1 if role == "moderator" else -1)
         logger.info(f"Admin '{username}' set user {user_id} role to '{role}'")
         return {"success": True, "role": role}
     except HTTPException:
@@ -1408,12 +2833,15 @@ def admin_suspend_user(user_id: int, data: dict = None, username: str = Depends(
     data = data or {}
     reason = _strip_html((data.get("reason") or "Account temporarily suspended"))[:300]
     try:
-        res = supabase.table(USER_TABLE).update({
+        before = db.table(USER_TABLE).select("id, is_banned").eq("id", user_id).execute().data
+        res = db.table(USER_TABLE).update({
             "is_banned": 1,
             "ban_reason": reason,
         }).eq("id", user_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="User not found")
+        if before and not before[0].get("is_banned"):
+            _count(["users.banned"])
         logger.info(f"Admin '{username}' suspended user {user_id}: {reason}")
         return {"success": True, "user_id": user_id, "suspended": True}
     except HTTPException:
@@ -1426,12 +2854,15 @@ def admin_suspend_user(user_id: int, data: dict = None, username: str = Depends(
 def admin_reactivate_user(user_id: int, username: str = Depends(require_admin)):
     """Admin — reactivate a suspended/banned user."""
     try:
-        res = supabase.table(USER_TABLE).update({
+        before = db.table(USER_TABLE).select("id, is_banned").eq("id", user_id).execute().data
+        res = db.table(USER_TABLE).update({
             "is_banned":  0,
             "ban_reason": None,
         }).eq("id", user_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="User not found")
+        if before and before[0].get("is_banned"):
+            _count(["users.banned"], -1)
         logger.info(f"Admin '{username}' reactivated user {user_id}")
         return {"success": True, "user_id": user_id}
     except HTTPException:
@@ -1443,23 +2874,15 @@ def admin_reactivate_user(user_id: int, username: str = Depends(require_admin)):
 # ── Extended user stats ──
 @app.get("/admin/users/stats")
 def admin_user_stats(username: str = Depends(require_admin)):
-    """Admin — aggregate stats about registered users."""
+    """Admin — aggregate stats about registered users (served from the running counters)."""
     try:
-        rows = supabase.table(USER_TABLE).select("id, is_banned, role, created_at").execute().data or []
-        now = datetime.utcnow()
-        week_ago = now - timedelta(days=7)
-        total   = len(rows)
-        active  = sum(1 for r in rows if not r.get("is_banned"))
-        banned  = sum(1 for r in rows if r.get("is_banned"))
-        mods    = sum(1 for r in rows if r.get("role") == "moderator")
-        new_7d  = sum(1 for r in rows if r.get("created_at") and
-                      datetime.fromisoformat(str(r["created_at"]).replace("Z","")) >= week_ago)
+        counts = _moderation_counts()
         return {
-            "total":   total,
-            "active":  active,
-            "banned":  banned,
-            "moderators": mods,
-            "new_7d":  new_7d,
+            "total":   counts.get("users.total", 0),
+            "active":  counts.get("users.total", 0) - counts.get("users.banned", 0),
+            "banned":  counts.get("users.banned", 0),
+            "moderators": counts.get("users.moderators", 0),
+            "new_7d":  counts["users.new_7d"],
         }
     except Exception as e:
         logger.error(f"admin_user_stats: {e}")
@@ -1484,7 +2907,7 @@ def admin_get_all_comments(
     show_hidden: all | visible | hidden
     """
     try:
-        rows = supabase.table("comments").select("*").order("id", desc=True).execute().data or []
+        rows = db.table("comments").select("*").order("id", desc=True).execute().data or []
     except Exception as e:
         logger.error(f"admin_get_all_comments: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1527,9 +2950,17 @@ def admin_get_all_comments(
 def admin_hide_comment(comment_id: int, username: str = Depends(require_admin)):
     """Admin — hide a comment from public view (soft delete)."""
     try:
-        res = supabase.table("comments").update({"is_hidden": True}).eq("id", comment_id).execute()
+        before = db.table("comments").select("id, is_hidden").eq("id", comment_id).execute().data
+        if not before:
+            raise HTTPException(status_code=404, detail="Comment not found")
+        res = db.table("comments").update({"is_hidden": True}).eq("id", comment_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="Comment not found")
+        if not before[0].get("is_hidden"):
+            _count(["comments.hidden"])
+            _comment_visibility(res.data[0], -1)
+        _invalidate_item_page(res.data[0].get("item_type"), res.data[0].get("item_id"))
+        _publish_comment("comment.remove", res.data[0])
         logger.info(f"Admin '{username}' hid comment {comment_id}")
         return {"success": True, "comment_id": comment_id, "hidden": True}
     except HTTPException:
@@ -1543,9 +2974,17 @@ def admin_hide_comment(comment_id: int, username: str = Depends(require_admin)):
 def admin_restore_comment(comment_id: int, username: str = Depends(require_admin)):
     """Admin — restore a previously hidden comment."""
     try:
-        res = supabase.table("comments").update({"is_hidden": False}).eq("id", comment_id).execute()
+        before = db.table("comments").select("id, is_hidden").eq("id", comment_id).execute().data
+        if not before:
+            raise HTTPException(status_code=404, detail="Comment not found")
+        res = db.table("comments").update({"is_hidden": False}).eq("id", comment_id).execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="Comment not found")
+        if before[0].get("is_hidden"):
+            _count(["comments.hidden"], -1)
+            _comment_visibility(res.data[0], 1)
+        _invalidate_item_page(res.data[0].get("item_type"), res.data[0].get("item_id"))
+        _publish_comment("comment.add", res.data[0])
         logger.info(f"Admin '{username}' restored comment {comment_id}")
         return {"success": True, "comment_id": comment_id, "hidden": False}
     except HTTPException:
@@ -1557,29 +2996,21 @@ def admin_restore_comment(comment_id: int, username: str = Depends(require_admin
 
 @app.get("/admin/comments/stats")
 def admin_comment_stats(username: str = Depends(require_admin)):
-    """Admin — aggregate comment moderation stats."""
+    """Admin — aggregate comment moderation stats (served from the running counters)."""
     try:
-        rows = supabase.table("comments").select("*").execute().data or []
+        counts = _moderation_counts()
     except Exception as e:
         logger.error(f"admin_comment_stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-    total    = len(rows)
-    positive = sum(1 for r in rows if r.get("sentiment") == "positive")
-    neutral  = sum(1 for r in rows if r.get("sentiment") == "neutral")
-    negative = sum(1 for r in rows if r.get("sentiment") == "negative")
-    toxic    = sum(1 for r in rows if (r.get("toxicity") or 0) >= 0.4)
-    flagged  = sum(1 for r in rows if (r.get("toxicity") or 0) >= 0.7)
-    hidden   = sum(1 for r in rows if r.get("is_hidden"))
-
     return {
-        "total":    total,
-        "positive": positive,
-        "neutral":  neutral,
-        "negative": negative,
-        "toxic":    toxic,
-        "flagged":  flagged,
-        "hidden":   hidden,
+        "total":    counts.get("comments.total", 0),
+        "positive": counts.get("comments.positive", 0),
+        "neutral":  counts.get("comments.neutral", 0),
+        "negative": counts.get("comments.negative", 0),
+        "toxic":    counts.get("comments.toxic", 0),
+        "flagged":  counts.get("comments.flagged", 0),
+        "hidden":   counts.get("comments.hidden", 0),
     }
 
 
@@ -1587,12 +3018,7 @@ def admin_comment_stats(username: str = Depends(require_admin)):
 @app.get("/comments/{item_type}/{item_id}/public")
 def get_comments_public(item_type: str, item_id: int):
     """Public — returns only non-hidden comments."""
-    return (supabase.table("comments")
-            .select("*")
-            .eq("item_type", item_type)
-            .eq("item_id", item_id)
-            .neq("is_hidden", True)
-            .execute().data)
+    return get_comments(item_type, item_id)
 
 
 # Extended stats including users
@@ -1600,20 +3026,356 @@ def get_comments_public(item_type: str, item_id: int):
 def stats_extended(username: str = Depends(require_admin)):
     """Extended stats including user counts."""
     try:
-        users = supabase.table(USER_TABLE).select("id, is_banned").execute().data or []
-        comments = supabase.table("comments").select("id, toxicity, is_hidden").execute().data or []
+        counts = _moderation_counts()
         return {
-            "quotes":    len(supabase.table("quotes").select("id").execute().data),
-            "stories":   len(supabase.table("stories").select("id").execute().data),
-            "blogs":     len(supabase.table("blogs").select("id").execute().data),
-            "comments":  len(comments),
-            "forumpost": len(supabase.table("forumpost").select("id").execute().data),
-            "users":     len(users),
-            "users_active": sum(1 for u in users if not u.get("is_banned")),
-            "users_banned": sum(1 for u in users if u.get("is_banned")),
-            "flagged_comments": sum(1 for c in comments if (c.get("toxicity") or 0) >= 0.7),
-            "hidden_comments":  sum(1 for c in comments if c.get("is_hidden")),
+            "quotes":    len(db.table("quotes").select("id").execute().data),
+            "stories":   len(db.table("stories").select("id").execute().data),
+            "blogs":     len(db.table("blogs").select("id").execute().data),
+            "comments":  counts.get("comments.total", 0),
+            "forumpost": len(db.table("forumpost").select("id").execute().data),
+            "users":     counts.get("users.total", 0),
+            "users_active": counts.get("users.total", 0) - counts.get("users.banned", 0),
+            "users_banned": counts.get("users.banned", 0),
+            "flagged_comments": counts.get("comments.flagged", 0),
+            "hidden_comments":  counts.get("comments.hidden", 0),
         }
     except Exception as e:
         logger.error(f"stats_extended: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# =========================================
+# BULK MODERATION
+# =========================================
+# Cleaning up a spam wave one hide/delete/ban at a time costs a request and
+# two round trips per item. The bulk endpoints take a list of ids — or, for
+# comments and forum posts, a filter such as {"min_toxicity": 0.7,
+# "username": "spammer"} — read the targets once, apply the change with a
+# single `in_` update or delete, and write one moderation_log row for the
+# whole batch. Counters, rankings and live events are updated in memory per
+# row; comment_count / reply_count bumps are grouped per item, so 300
+# comments on one story cost one bump.
+#
+# The repository API has no transaction spanning two tables (PostgREST can't
+# offer one), so the audit row is written first, listing every target, and
+# corrected to the ids that actually changed afterwards. A batch whose audit
+# row can't be written is refused with 503 rather than applied unrecorded.
+#
+# Every response carries a per-id result: the new state, "unchanged" (it was
+# already in that state) or "not_found". A filter selects at most
+# BULK_MAX_IDS rows per call, lowest ids first; "more": true means call again.
+#
+# One-time Supabase setup (SQL editor):
+#   create table if not exists moderation_log (
+#     id bigint generated always as identity primary key,
+#     admin text not null, action text not null, target_type text not null,
+#     target_ids text, filter text, affected integer not null default 0,
+#     created_at timestamptz not null default now());
+# Until then the bulk endpoints answer 503.
+BULK_MAX_IDS = int(os.getenv("BULK_MAX_IDS", "500"))
+
+def _filter_bool(value) -> bool:
+    """JSON true/false or "true"/"false"/"1"/"0" — bool() would make "false" true."""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower() if isinstance(value, (str, int)) else None
+    if text in ("true", "1"):
+        return True
+    if text in ("false", "0"):
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+_BULK_COMMENT_FILTERS = {
+    # filter key: (query method, column, cast)
+    "min_toxicity": ("gte", "toxicity", float),
+    "username":     ("eq", "username", str),
+    "user_id":      ("eq", "user_id", int),
+    "item_type":    ("eq", "item_type", str),
+    "item_id":      ("eq", "item_id", int),
+    "sentiment":    ("eq", "sentiment", str),
+    "hidden":       ("eq", "is_hidden", _filter_bool),
+}
+_BULK_FORUM_FILTERS = {
+    "name":      ("eq", "name", str),
+    "parent_id": ("eq", "parent_id", int),
+}
+_BULK_DONE = {"hide": "hidden", "restore": "restored", "delete": "deleted", "ban": "banned", "unban": "unbanned"}
+
+def _bulk_ids(data: dict) -> list | None:
+    ids = data.get("ids")
+    if ids is None:
+        return None
+    if not isinstance(ids, list) or not ids:
+        raise HTTPException(status_code=400, detail="ids must be a non-empty list")
+    try:
+        ids = list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="ids must be integers")
+    if len(ids) > BULK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_IDS} ids per request")
+    return ids
+
+def _bulk_filter(raw, allowed: dict, table: str) -> list:
+    """[(method, column, value), ...] from a request's filter object."""
+    if raw is None:
+        return []
+    if not isinstance(raw, dict) or not raw:
+        raise HTTPException(status_code=400, detail="filter must be a non-empty object")
+    unknown = sorted(set(raw) - set(allowed))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown filter keys {unknown}; use {sorted(allowed)}")
+    clauses = []
+    for key, value in raw.items():
+        method, column, cast = allowed[key]
+        if column in _OPTIONAL_COLUMNS.get(table, ()) and not _has_column(table, column):
+            raise HTTPException(status_code=400, detail=f"Filter '{key}' needs the {table}.{column} column")
+        try:
+            clauses.append((method, column, cast(value)))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Invalid value for filter '{key}'")
+    return clauses
+
+def _bulk_select(table: str, columns: str, ids: list | None, clauses: list) -> tuple:
+    """(rows, more) — the batch's targets as they are before the change."""
+    if ids is None and not clauses:
+        raise HTTPException(status_code=400, detail="Provide ids or a filter")
+    query = db.table(table).select(columns)
+    if ids is not None:
+        query = query.in_("id", ids)
+    for method, column, value in clauses:
+        query = getattr(query, method)(column, value)
+    rows = query.order("id").limit(BULK_MAX_IDS + 1).execute().data or []
+    return rows[:BULK_MAX_IDS], len(rows) > BULK_MAX_IDS
+
+def _bulk_results(ids: list | None, rows: list, changed: list, done: str) -> dict:
+    """{id: done | "unchanged" | "not_found"} for every requested (or matched) id."""
+    found = {r["id"] for r in rows}
+    changed_ids = {r["id"] for r in changed}
+    return {i: done if i in changed_ids else "unchanged" if i in found else "not_found"
+            for i in (ids if ids is not None else [r["id"] for r in rows])}
+
+def _moderation_log_open(admin: str, action: str, target_type: str, target_ids: list, raw_filter) -> int | None:
+    """
+    Write the batch's audit row before anything changes, listing every target.
+    If it can't be written the batch is refused, so nothing is ever moderated
+    without a record.
+    """
+    entry = {
+        "admin": admin,
+        "action": action,
+        "target_type": target_type,
+        "target_ids": json.dumps(target_ids),
+        "filter": json.dumps(raw_filter) if raw_filter else None,
+        "affected": len(target_ids),
+    }
+    try:
+        res = db.table("moderation_log").insert(entry).execute()
+    except Exception as e:
+        logger.error(f"moderation_log not written, {action} refused: {e}")
+        raise HTTPException(status_code=503, detail="Could not write the moderation log — nothing was changed")
+    return res.data[0]["id"] if res.data else None
+
+def _moderation_log_close(log_id: int | None, action: str, changed: list):
+    """Narrow the audit row to the ids that actually changed. On failure it keeps listing all targets."""
+    if log_id is None:
+        return
+    try:
+        (db.table("moderation_log")
+         .update({"target_ids": json.dumps(changed), "affected": len(changed)})
+         .eq("id", log_id).execute())
+    except Exception as e:
+        logger.error(f"moderation_log {log_id} ({action}) still lists every target, not the {len(changed)} changed: {e}")
+
+def _comments_visibility(rows: list, delta: int):
+    """_comment_visibility for many comments, one comment_count bump per item."""
+    per_item = Counter((r.get("item_type"), r.get("item_id")) for r in rows)
+    for (item_type, item_id), n in per_item.items():
+        _bump_comment_count(item_type, item_id, delta * n)
+        _invalidate_item_page(item_type, item_id)
+    for row in rows:
+        _rankings.comment(row.get("item_type"), row.get("item_id"), _epoch(row.get("created_at")), delta)
+
+
+@app.post("/admin/bulk/comments")
+def bulk_moderate_comments(data: dict, username: str = Depends(require_admin)):
+    """
+    Admin — hide, restore or delete many comments in one call.
+    Body: {"action": "hide" | "restore" | "delete", "ids": [...]} and/or
+          {"filter": {"min_toxicity": 0.7, "username": "...", "item_type": "story", ...}}
+    """
+    action = (data.get("action") or "").strip().lower()
+    if action not in ("hide", "restore", "delete"):
+        raise HTTPException(status_code=400, detail="action must be 'hide', 'restore' or 'delete'")
+    if action != "delete" and not _has_column("comments", "is_hidden"):
+        raise HTTPException(status_code=400, detail="Hiding comments needs the comments.is_hidden column")
+    ids = _bulk_ids(data)
+    clauses = _bulk_filter(data.get("filter"), _BULK_COMMENT_FILTERS, "comments")
+    try:
+        rows, more = _bulk_select("comments", "*", ids, clauses)
+        if action == "delete":
+            targets = rows
+        else:
+            targets = [r for r in rows if bool(r.get("is_hidden")) != (action == "hide")]
+
+        log_id = _moderation_log_open(username, f"comments.{action}", "comments",
+                                      [r["id"] for r in targets], data.get("filter"))
+        changed = []
+        if targets:
+            query = db.table("comments")
+            query = query.delete() if action == "delete" else query.update({"is_hidden": action == "hide"})
+            changed = query.in_("id", [r["id"] for r in targets]).execute().data or []
+
+        if action == "delete":
+            for row in changed:
+                _count(_comment_buckets(row), -1)
+            _comments_visibility([r for r in changed if not r.get("is_hidden")], -1)
+        else:
+            _count(["comments.hidden"], len(changed) if action == "hide" else -len(changed))
+            _comments_visibility(changed, -1 if action == "hide" else 1)
+        for row in changed:
+            _publish_comment("comment.add" if action == "restore" else "comment.remove", row)
+
+        changed_ids = [r["id"] for r in changed]
+        _moderation_log_close(log_id, f"comments.{action}", changed_ids)
+        logger.info(f"Admin '{username}' bulk-{action} {len(changed_ids)} comments")
+        return {
+            "action": action,
+            "affected": len(changed_ids),
+            "more": more,
+            "log_id": log_id,
+            "results": _bulk_results(ids, rows, changed, _BULK_DONE[action]),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"bulk_moderate_comments {action}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/admin/bulk/forum")
+def bulk_delete_forum_posts(data: dict, username: str = Depends(require_admin)):
+    """
+    Admin — delete many forum posts in one call (a deleted thread takes its replies with it).
+    Body: {"action": "delete", "ids": [...]} and/or {"filter": {"name": "...", "parent_id": 12}}
+    """
+    action = (data.get("action") or "delete").strip().lower()
+    if action != "delete":
+        raise HTTPException(status_code=400, detail="action must be 'delete'")
+    ids = _bulk_ids(data)
+    clauses = _bulk_filter(data.get("filter"), _BULK_FORUM_FILTERS, "forumpost")
+    threaded = _forum_threaded()
+    try:
+        rows, more = _bulk_select("forumpost", _columns("forumpost", "id", "parent_id"), ids, clauses)
+        target_ids = [r["id"] for r in rows]
+        # A deleted thread takes its replies with it; the entry is corrected to list them below.
+        log_id = _moderation_log_open(username, "forumpost.delete", "forumpost", target_ids, data.get("filter"))
+        cascaded = []
+        if threaded and target_ids:
+            # Replies first — see delete_forum_post.
+            cascaded = db.table("forumpost").delete().in_("parent_id", target_ids).execute().data or []
+        changed = []
+        if target_ids:
+            changed = db.table("forumpost").delete().in_("id", target_ids).execute().data or []
+
+        gone = {r["id"] for r in changed} | {r["id"] for r in cascaded}
+        if threaded:
+            per_thread = Counter(r["parent_id"] for r in changed if r.get("parent_id") and r["parent_id"] not in gone)
+            for parent_id, n in per_thread.items():
+                _bump_reply_count(parent_id, -n)
+        if gone:
+            _cache_invalidate("bootstrap")
+        for post_id in sorted(gone):
+            hub.publish("forum.remove", {"id": post_id})
+
+        changed_ids = [r["id"] for r in changed]
+        _moderation_log_close(log_id, "forumpost.delete", changed_ids + [r["id"] for r in cascaded])
+        logger.info(f"Admin '{username}' bulk-deleted {len(changed_ids)} forum posts (+{len(cascaded)} replies)")
+        return {
+            "action": action,
+            "affected": len(changed_ids),
+            "replies_deleted": len(cascaded),
+            "more": more,
+            "log_id": log_id,
+            "results": _bulk_results(ids, rows, changed + cascaded, "deleted"),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"bulk_delete_forum_posts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/admin/bulk/users")
+def bulk_moderate_users(data: dict, username: str = Depends(require_admin)):
+    """
+    Admin — ban, unban or delete many site users in one call.
+    Body: {"action": "ban" | "unban" | "delete", "ids": [...], "reason": "..."}
+    """
+    action = (data.get("action") or "").strip().lower()
+    if action not in ("ban", "unban", "delete"):
+        raise HTTPException(status_code=400, detail="action must be 'ban', 'unban' or 'delete'")
+    ids = _bulk_ids(data)
+    if ids is None:
+        raise HTTPException(status_code=400, detail="ids is required")
+    reason = _strip_html((data.get("reason") or "Account suspended by admin"))[:300]
+    try:
+        rows, _ = _bulk_select(USER_TABLE, "id, is_banned, role, created_at", ids, [])
+        if action == "delete":
+            targets = rows
+        else:
+            targets = [r for r in rows if bool(r.get("is_banned")) != (action == "ban")]
+
+        log_id = _moderation_log_open(username, f"users.{action}", "users", [r["id"] for r in targets],
+                                      {"reason": reason} if action == "ban" else None)
+        changed = []
+        if targets:
+            query = db.table(USER_TABLE)
+            if action == "delete":
+                query = query.delete()
+            elif action == "ban":
+                query = query.update({"is_banned": 1, "ban_reason": reason})
+            else:
+                query = query.update({"is_banned": 0, "ban_reason": None})
+            changed = query.in_("id", [r["id"] for r in targets]).execute().data or []
+
+        if action == "delete":
+            for row in changed:
+                _count(_user_buckets(row), -1)
+                _count_signup(row.get("created_at"), -1)
+        else:
+            _count(["users.banned"], len(changed) if action == "ban" else -len(changed))
+
+        changed_ids = [r["id"] for r in changed]
+        _moderation_log_close(log_id, f"users.{action}", changed_ids)
+        logger.info(f"Admin '{username}' bulk-{action} {len(changed_ids)} users" + (f": {reason}" if action == "ban" else ""))
+        return {
+            "action": action,
+            "affected": len(changed_ids),
+            "log_id": log_id,
+            "results": _bulk_results(ids, rows, changed, _BULK_DONE[action]),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"bulk_moderate_users {action}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/admin/moderation-log")
+def get_moderation_log(limit: int = 50, offset: int = 0, username: str = Depends(require_admin)):
+    """Admin — recent bulk moderation actions, newest first."""
+    limit = max(1, min(limit, 200))
+    try:
+        rows = (db.table("moderation_log").select("*").order("id", desc=True)
+                .range(max(offset, 0), max(offset, 0) + limit - 1).execute().data or [])
+    except Exception as e:
+        logger.error(f"get_moderation_log: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    for row in rows:
+        for key in ("target_ids", "filter"):
+            if isinstance(row.get(key), str):
+                try:
+                    row[key] = json.loads(row[key])
+                except ValueError:
+                    pass
+    return rows
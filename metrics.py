@@ -0,0 +1,237 @@
+import time
+import weakref
+from bisect import bisect_left
+from threading import RLock, local
+
+# =========================
+# LOCK-FREE METRICS
+# =========================
+# Every thread writes to its own shard (a plain dict), so recording a sample
+# is a couple of dict operations with no lock. Shards are only merged when
+# /metrics is scraped. The event loop and each threadpool worker get one shard
+# apiece; the lock below is taken once per thread, on its first sample.
+#
+# Threadpool workers come and go (anyio retires one after 10s idle), so when a
+# thread exits its shard is folded into _base under the lock and dropped —
+# _shards stays as long as the number of live threads, not every thread ever.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_shards: list = []
+_shards_lock = RLock()   # re-entrant: a finalizer may run _retire on a thread already holding it
+_base: dict = {}         # totals from shards of threads that have exited
+_local = local()
+_metrics: list = []
+_collectors: list = []   # (name, help, fn) gauges computed at scrape time
+_started = time.time()
+
+
+class _Owner:
+    """Lives only in its thread's local storage, so it's collected when the thread exits."""
+
+
+def _shard() -> dict:
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        _local.owner = _Owner()
+        weakref.finalize(_local.owner, _retire, shard)
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+
+def _retire(shard: dict):
+    """Fold a dead thread's shard into _base. Nothing writes to it any more."""
+    with _shards_lock:
+        _fold(_base, shard)
+        _shards.remove(shard)
+
+
+def _fold(into: dict, shard: dict):
+    for key, value in list(shard.items()):
+        if isinstance(value, list):
+            total = into.get(key)
+            into[key] = list(value) if total is None else [a + b for a, b in zip(total, value)]
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        _metrics.append(self)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        shard = _shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    """Up/down counter — each shard holds its own delta, the sum is the value."""
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        shard = _shard()
+        key = (self.name, labels)
+        entry = shard.get(key)
+        if entry is None:
+            # [per-bucket counts..., +Inf count, sum]
+            entry = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+
+def collector(name: str, help: str, fn):
+    """Register a gauge whose value is read from `fn()` at scrape time."""
+    _collectors.append((name, help, fn))
+
+
+# =========================
+# EXPOSITION
+# =========================
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _merged() -> dict:
+    merged: dict = {}
+    with _shards_lock:
+        # Taken together, so a shard retired mid-scrape is counted exactly once
+        _fold(merged, _base)
+        shards = list(_shards)
+    for shard in shards:
+        _fold(merged, shard)
+    return merged
+
+
+def render() -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    merged = _merged()
+    by_name: dict = {}
+    for (name, labels), value in merged.items():
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in sorted(by_name.get(metric.name, []), key=lambda s: s[0]):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_label_str(metric.labels, labels)} {value:g}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float("inf"),), value[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{metric.name}_bucket{_label_str(metric.labels, labels, le)} {cumulative}")
+            lines.append(f"{metric.name}_sum{_label_str(metric.labels, labels)} {value[-1]:.6f}")
+            lines.append(f"{metric.name}_count{_label_str(metric.labels, labels)} {cumulative}")
+
+    for name, help, fn in _collectors:
+        try:
+            value = fn()
+        except Exception:
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value:g}")
+
+    lines.append("# HELP quoteme_uptime_seconds Seconds since the process started.")
+    lines.append("# TYPE quoteme_uptime_seconds gauge")
+    lines.append(f"quoteme_uptime_seconds {time.time() - _started:.0f}")
+    return "\n".join(lines) + "\n"
+
+
+# =========================
+# APP METRICS
+# =========================
+HTTP_REQUEST_SECONDS = Histogram(
+    "quoteme_http_request_duration_seconds", "Request latency by route template.", ("method", "route"))
+HTTP_REQUESTS = Counter(
+    "quoteme_http_requests_total", "Requests by route template and status code.", ("method", "route", "status"))
+HTTP_IN_FLIGHT = Gauge(
+    "quoteme_http_requests_in_flight", "Requests currently being handled.")
+RATE_LIMITED = Counter(
+    "quoteme_rate_limited_total", "Requests rejected by the in-memory rate limiter.", ("bucket",))
+DB_QUERY_SECONDS = Histogram(
+    "quoteme_db_query_duration_seconds", "Data-access latency by table and operation.", ("table", "operation"))
+DB_QUERY_ERRORS = Counter(
+    "quoteme_db_query_errors_total", "Data-access calls that raised.", ("table", "operation"))
+DB_COALESCED = Counter(
+    "quoteme_db_coalesced_total", "Reads served by joining an identical in-flight query.", ("table",))
+
+
+def observe_coalesced(table: str):
+    """Callback for repository.CoalescingRepository."""
+    DB_COALESCED.inc(table)
+
+
+def observe_query(table: str, operation: str, seconds: float, ok: bool):
+    """Callback for repository.InstrumentedRepository."""
+    DB_QUERY_SECONDS.observe(seconds, table, operation)
+    if not ok:
+        DB_QUERY_ERRORS.inc(table, operation)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status and in-flight count per route
+    template (e.g. "/stories/{story_id}"), so path parameters don't explode
+    label cardinality. Unmatched paths are grouped under "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method, route)
+            HTTP_REQUESTS.inc(method, route, str(status))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -26,14 +26,17 @@ class Quote(Base):
     author = Column(String, nullable=True)
     image_url = Column(String, nullable=True)
     likes = Column(Integer, default=0)
+    comment_count = Column(Integer, default=0)      # visible comments, see main._bump_comment_count
 
 class Story(Base):
     __tablename__ = "stories"
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     content = Column(Text, nullable=False)
+    excerpt = Column(String(300), nullable=True)   # plain-text teaser for cards
     image_url = Column(String(300), nullable=True)
     likes = Column(Integer, default=0)
+    comment_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Blog(Base):
@@ -41,8 +44,10 @@ class Blog(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     content = Column(Text, nullable=False)
+    excerpt = Column(String(300), nullable=True)   # plain-text teaser for cards
     image_url = Column(String(300), nullable=True)
     likes = Column(Integer, default=0)
+    comment_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Comment(Base):
@@ -54,19 +59,31 @@ class Comment(Base):
     item_type = Column(String(20), nullable=False)    # quote / story / blog
     item_id = Column(Integer, nullable=False)
     sentiment = Column(String(20), default="neutral")
+    toxicity = Column(Float, default=0.0)             # 0.0–1.0, see main._toxicity
     is_hidden = Column(Integer, default=0)            # 0=visible, 1=hidden by admin
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_comments_item", "item_type", "item_id", "is_hidden"),
+        Index("ix_comments_user_id", "user_id"),
+    )
+
 class ForumPost(Base):
     __tablename__ = "forumpost"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     user_id = Column(Integer, nullable=True)          # FK to site_users.id
     message = Column(String, nullable=False)
+    parent_id = Column(Integer, ForeignKey("forumpost.id"), nullable=True)   # thread root; NULL = top-level
+    reply_count = Column(Integer, default=0)          # replies under a top-level post
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_forumpost_parent", "parent_id", "id"),
+    )
+
 class ContactMessage(Base):
-    __tablename__ = "contact_messages"
+    __tablename__ = "contactmessage"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     email = Column(String, nullable=False)
@@ -89,3 +106,14 @@ class SiteUser(Base):
     ban_reason    = Column(String(300), nullable=True)
     created_at    = Column(DateTime, default=datetime.utcnow)
     last_seen     = Column(DateTime, default=datetime.utcnow)
+
+class ModerationLog(Base):
+    __tablename__ = "moderation_log"
+    id          = Column(Integer, primary_key=True, index=True)
+    admin       = Column(String(50), nullable=False)
+    action      = Column(String(40), nullable=False)     # e.g. comments.hide, users.ban
+    target_type = Column(String(20), nullable=False)     # comments / forumpost / users
+    target_ids  = Column(Text, nullable=True)            # JSON list of ids actually changed
+    filter      = Column(Text, nullable=True)            # JSON filter the batch was selected by, if any
+    affected    = Column(Integer, default=0)
+    created_at  = Column(DateTime, default=datetime.utcnow)
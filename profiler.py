@@ -0,0 +1,230 @@
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from itertools import count
+
+# =========================
+# SAMPLING PROFILER
+# =========================
+# Off by default. When enabled (from the admin API), a background thread
+# snapshots every thread's Python stack each PROFILE_INTERVAL_MS while
+# tracked requests are in flight, and attributes the samples to those
+# requests. A request's profile is kept if it was randomly sampled or ran
+# longer than the slow threshold; the last PROFILE_KEEP profiles are held in
+# a ring and served as collapsed stacks (flamegraph.pl / speedscope input).
+#
+# Samples cover the whole process, so a request that overlapped others also
+# sees their stacks. Each stack is rooted at its thread name and each profile
+# records the peak concurrency, so those cases are easy to tell apart.
+#
+# Disabled cost: one attribute check per request.
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+MAX_STACK_DEPTH = 64
+
+# Leaf frames of a thread that's parked, not working — not worth a sample.
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+}
+
+# Long-lived streams would keep the sampler running for as long as a client
+# stays connected.
+SKIP_PATHS = {"/events"}
+
+
+def _as_bool(name: str, value) -> bool:
+    """JSON true/false or "true"/"false"/"1"/"0" — bool() would turn "false" on."""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower() if isinstance(value, (str, int)) else None
+    if text in ("true", "1"):
+        return True
+    if text in ("false", "0"):
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+
+def _as_number(name: str, value) -> float:
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number") from None
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be a number")
+    return number
+
+
+class _Session:
+    __slots__ = ("id", "started", "sampled", "stacks", "samples", "peak_concurrency")
+
+    def __init__(self, session_id: int, sampled: bool):
+        self.id = session_id
+        self.started = time.perf_counter()
+        self.sampled = sampled
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.peak_concurrency = 1
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = PROFILE_SAMPLE_RATE
+        self.slow_ms = PROFILE_SLOW_MS
+        self.interval = PROFILE_INTERVAL_MS / 1000
+        self.profiles: deque = deque(maxlen=PROFILE_KEEP)
+        self._active: dict = {}
+        self._ids = count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # ── control ──
+    def configure(self, enabled: bool = None, sample_rate: float = None, slow_ms: float = None):
+        """Apply the given settings; raises ValueError (changing nothing) if any is malformed."""
+        # Parse everything first, so a bad value doesn't leave a half-applied update.
+        if sample_rate is not None:
+            sample_rate = min(max(_as_number("sample_rate", sample_rate), 0.0), 1.0)
+        if slow_ms is not None:
+            slow_ms = max(_as_number("slow_ms", slow_ms), 0.0)
+        if enabled is not None:
+            enabled = _as_bool("enabled", enabled)
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if enabled is not None:
+            self.enabled = enabled
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "interval_ms": self.interval * 1000,
+            "keep": self.profiles.maxlen,
+            "active": len(self._active),
+            "profiles": [{k: v for k, v in p.items() if k != "stacks"} for p in list(self.profiles)],
+        }
+
+    def get(self, profile_id: int) -> dict | None:
+        for p in list(self.profiles):
+            if p["id"] == profile_id:
+                return p
+        return None
+
+    def clear(self):
+        self.profiles.clear()
+
+    # ── per-request ──
+    def begin(self) -> _Session:
+        session = _Session(next(self._ids), random.random() < self.sample_rate)
+        with self._lock:
+            self._active[session.id] = session
+            concurrency = len(self._active)
+            for s in self._active.values():
+                s.peak_concurrency = max(s.peak_concurrency, concurrency)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._thread.start()
+        return session
+
+    def end(self, session: _Session, method: str, path: str, route: str, status: int):
+        with self._lock:
+            self._active.pop(session.id, None)
+        duration_ms = (time.perf_counter() - session.started) * 1000
+        slow = self.slow_ms > 0 and duration_ms >= self.slow_ms
+        if not (session.sampled or slow) or not session.samples:
+            return
+        self.profiles.append({
+            "id": session.id,
+            "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(duration_ms, 1),
+            "reason": "slow" if slow else "sampled",
+            "samples": session.samples,
+            "peak_concurrency": session.peak_concurrency,
+            "stacks": session.stacks,
+        })
+
+    # ── sampler thread ──
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                sessions = list(self._active.values())
+                if not sessions:
+                    self._thread = None
+                    return
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = [
+                _collapse(frame, names.get(ident, str(ident)))
+                for ident, frame in sys._current_frames().items() if ident != me
+            ]
+            stacks = [s for s in stacks if s]
+            for session in sessions:
+                session.samples += 1
+                session.stacks.update(stacks)
+
+
+def _collapse(frame, thread_name: str) -> str | None:
+    """Root-to-leaf "thread;file:func;..." string, or None for an idle thread."""
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+        return None
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    parts.append(thread_name.replace(";", ","))
+    return ";".join(reversed(parts))
+
+
+def collapsed(profile: dict) -> str:
+    """Brendan Gregg collapsed-stack text: one "frame;frame;... count" per line."""
+    return "".join(f"{stack} {n}\n" for stack, n in profile["stacks"].most_common())
+
+
+profiler = Profiler()
+
+
+class ProfilerMiddleware:
+    """ASGI middleware feeding `profiler`. Passes straight through while disabled."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profiler.enabled or scope["type"] != "http" or scope["path"] in SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        session = profiler.begin()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            profiler.end(session, scope["method"], scope["path"], route, status)
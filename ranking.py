@@ -0,0 +1,163 @@
+import math
+import os
+import time
+from threading import Lock
+
+import numpy as np
+
+# =========================
+# TRENDING / POPULAR RANKINGS
+# =========================
+# Each item has two scores:
+#
+#   popular   likes + COMMENT_WEIGHT × visible comments, all time
+#   trending  the same events, each weighted 2^(-age / half-life)
+#
+# Scores live in NumPy arrays, one pair per item type, and each board keeps a
+# precomputed top-K tuple. A read just returns that tuple. A like or comment
+# moves one score and, if it matters, re-sorts the K-sized tuple; only a
+# removal from inside the top K forces an argpartition over the whole array.
+#
+# Trending scores are stored relative to a reference time t0: an event at t
+# adds w·e^(λ(t - t0)). Decay scales every score by the same factor, so the
+# order never changes just because time passes. A periodic full rebuild from
+# the database (vectorized over all comments) moves t0 forward and corrects
+# drift.
+#
+#   TRENDING_HALF_LIFE_HOURS  how fast trending forgets (24)
+#   RANKING_COMMENT_WEIGHT    one comment is worth this many likes (3)
+#   RANKING_TOP_K             items kept per board (50)
+
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24"))
+RANKING_COMMENT_WEIGHT = float(os.getenv("RANKING_COMMENT_WEIGHT", "3"))
+RANKING_TOP_K = int(os.getenv("RANKING_TOP_K", "50"))
+
+BOARDS = ("trending", "popular")
+
+
+class Board:
+    """Scores for one item type, plus its top K as ((id, score), ...) best first."""
+
+    def __init__(self, top_k: int = RANKING_TOP_K):
+        self.top_k = top_k
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.scores = np.zeros(0)
+        self.top: tuple = ()
+        self._pos: dict = {}
+        self._lock = Lock()
+
+    def load(self, ids: np.ndarray, scores: np.ndarray):
+        with self._lock:
+            self.ids, self.scores = ids, scores
+            self._pos = {item_id: pos for pos, item_id in enumerate(ids.tolist())}
+            self._recompute_top()
+
+    def add(self, item_id: int, delta: float):
+        with self._lock:
+            pos = self._pos.get(item_id)
+            if pos is None:   # content created since the last rebuild
+                pos = self._pos[item_id] = len(self.ids)
+                self.ids = np.append(self.ids, np.int64(item_id))
+                self.scores = np.append(self.scores, 0.0)
+            self.scores[pos] += delta
+            score = float(self.scores[pos])
+
+            top = dict(self.top)
+            if delta < 0 and item_id in top:
+                self._recompute_top()   # something outside the top K may now outrank it
+                return
+            if score <= 0:
+                return
+            if item_id in top or len(top) < self.top_k or score > self.top[-1][1]:
+                top[item_id] = score
+                self.top = tuple(sorted(top.items(), key=lambda kv: -kv[1])[:self.top_k])
+
+    def _recompute_top(self):
+        positive = np.flatnonzero(self.scores > 0)
+        if len(positive) > self.top_k:
+            positive = positive[np.argpartition(-self.scores[positive], self.top_k - 1)[:self.top_k]]
+        order = positive[np.argsort(-self.scores[positive], kind="stable")]
+        self.top = tuple(zip(self.ids[order].tolist(), self.scores[order].tolist()))
+
+
+class Rankings:
+    def __init__(self, half_life_hours: float = TRENDING_HALF_LIFE_HOURS,
+                 comment_weight: float = RANKING_COMMENT_WEIGHT, top_k: int = RANKING_TOP_K):
+        self.half_life = half_life_hours * 3600
+        self.rate = math.log(2) / self.half_life
+        self.comment_weight = comment_weight
+        self.top_k = top_k
+        self.t0 = time.time()
+        self.built_at = 0.0
+        self.boards: dict = {}   # (board, item_type) -> Board
+
+    def board(self, name: str, item_type: str) -> Board:
+        board = self.boards.get((name, item_type))
+        if board is None:
+            board = self.boards.setdefault((name, item_type), Board(self.top_k))
+        return board
+
+    # ── reads ──
+    def top(self, name: str, item_type: str, limit: int) -> list:
+        """[(id, score), ...] best first. Trending scores are as of now."""
+        entries = self.board(name, item_type).top[:limit]
+        if name == "trending":
+            scale = math.exp(-self.rate * (time.time() - self.t0))
+            return [(item_id, score * scale) for item_id, score in entries]
+        return list(entries)
+
+    # ── events ──
+    def like(self, item_type: str, item_id: int):
+        self._record(item_type, item_id, 1.0, time.time())
+
+    def comment(self, item_type: str, item_id: int, at: float = None, delta: int = 1):
+        """A comment became visible (+1) or stopped being visible (-1). `at` is its created_at."""
+        self._record(item_type, item_id, delta * self.comment_weight, at or time.time())
+
+    def _record(self, item_type: str, item_id, weight: float, at: float):
+        if not self.built_at or item_id is None:
+            return   # the first rebuild will count it
+        self.board("popular", item_type).add(int(item_id), weight)
+        self.board("trending", item_type).add(int(item_id), weight * math.exp(self.rate * (at - self.t0)))
+
+    # ── batch ──
+    def rebuild(self, items: dict, comments: dict, now: float = None):
+        """
+        Recompute every board from scratch and move t0 to `now`.
+
+        items     item_type -> (ids, likes, created_at epochs; NaN if unknown)
+        comments  item_type -> (item ids, created_at epochs) of visible comments
+
+        Likes carry no timestamp, so an item's likes are dated at its own
+        created_at; undated items (quotes) count them one half-life old.
+        """
+        now = time.time() if now is None else now
+        loaded = {}
+        for item_type, (ids, likes, created) in items.items():
+            ids = np.asarray(ids, dtype=np.int64)
+            order = np.argsort(ids)
+            ids = ids[order]
+            likes = np.nan_to_num(np.asarray(likes, dtype=float)[order])
+            created = np.asarray(created, dtype=float)[order]
+            created = np.where(np.isnan(created), now - self.half_life, np.minimum(created, now))
+
+            c_ids, c_times = comments.get(item_type, ((), ()))
+            c_ids = np.asarray(c_ids, dtype=np.int64)
+            c_times = np.asarray(c_times, dtype=float)
+            c_times = np.where(np.isnan(c_times), now, np.minimum(c_times, now))
+            pos = np.searchsorted(ids, c_ids)
+            known = pos < len(ids)
+            known[known] = ids[pos[known]] == c_ids[known]   # drop comments on deleted items
+            pos, c_times = pos[known], c_times[known]
+
+            counts = np.bincount(pos, minlength=len(ids))
+            decayed = np.bincount(pos, weights=np.exp(self.rate * (c_times - now)), minlength=len(ids))
+            popular = likes + self.comment_weight * counts
+            trending = likes * np.exp(self.rate * (created - now)) + self.comment_weight * decayed
+            loaded[item_type] = (ids, popular, trending)
+
+        self.t0 = now
+        for item_type, (ids, popular, trending) in loaded.items():
+            self.board("popular", item_type).load(ids, popular)
+            self.board("trending", item_type).load(ids.copy(), trending)
+        self.built_at = time.time()
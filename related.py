@@ -0,0 +1,239 @@
+import os
+import re
+import time
+from collections import Counter
+from threading import Lock
+
+import numpy as np
+from scipy import sparse
+
+# =========================
+# RELATED CONTENT INDEX
+# =========================
+# "You may also like" for quotes, stories and blogs. Each item becomes a TF-IDF
+# vector (sublinear tf, smoothed idf, L2-normalised) in one sparse matrix.
+# A full build multiplies the matrix by its transpose in row chunks and keeps
+# each item's RELATED_TOP_N nearest neighbours by cosine similarity. Reads are
+# a dict lookup of those precomputed lists.
+#
+# Between full builds, upsert()/remove() only touch the rows that change: the
+# edited item is re-vectorised against the current vocabulary and scored
+# against everything with one sparse mat-vec. Every other item's neighbour list
+# is adjusted only if the edited item enters it, moves within it or drops out.
+# New words wait for the next full build to get an idf.
+#
+# The same matrix answers free-text search (the chatbot's retrieval mode): the
+# query becomes a vector in the same space and one mat-vec ranks every item.
+#
+#   RELATED_TOP_N  neighbours kept per item (8)
+
+RELATED_TOP_N = int(os.getenv("RELATED_TOP_N", "8"))
+CHUNK_ROWS = 256
+TITLE_WEIGHT = 2      # a title word counts as much as this many body words
+SNIPPET_CHARS = 160
+
+_TOKEN = re.compile(r"[a-z][a-z0-9']+")
+_STOPWORDS = frozenset("""
+    about above after again against all also and any are because been before being below between both but
+    can could did does doing down during each few for from further had has have having her here hers herself
+    him himself his how into its itself just let like more most much must myself nor not now off once only
+    other our ours ourselves out over own same she should some such than that the their theirs them themselves
+    then there these they this those through too under until very was were what when where which while who
+    whom why will with would you your yours yourself yourselves
+""".split())
+
+
+def tokenize(text: str) -> list:
+    return [t for t in (w.strip("'") for w in _TOKEN.findall(text.lower()))
+            if len(t) > 2 and t not in _STOPWORDS]
+
+
+def _term_counts(title: str, body: str) -> Counter:
+    counts = Counter(tokenize(body))
+    for term in tokenize(title):
+        counts[term] += TITLE_WEIGHT
+    return counts
+
+
+def snippet(body: str, terms: list, size: int = SNIPPET_CHARS) -> str:
+    """About `size` characters of `body` around the first query term it contains."""
+    text = " ".join(body.split())
+    lowered = text.lower()
+    hits = [i for i in (lowered.find(t) for t in terms) if i >= 0]
+    start = max(min(hits) - size // 4, 0) if hits else 0
+    if start:
+        space = text.find(" ", start)
+        start = space + 1 if 0 <= space < min(hits) else start
+    end = min(start + size, len(text))
+    if end < len(text):
+        cut = text.rfind(" ", start, end)
+        end = cut if cut > start else end
+    return ("…" if start else "") + text[start:end] + ("…" if end < len(text) else "")
+
+
+class RelatedIndex:
+    def __init__(self, top_n: int = RELATED_TOP_N):
+        self.top_n = top_n
+        self.keys: list = []           # matrix row -> (item_type, id)
+        self.cards: dict = {}          # (item_type, id) -> what /related returns for it
+        self.bodies: dict = {}         # (item_type, id) -> plain text, for snippets and snapshots
+        self.titles: dict = {}
+        self.neighbours: dict = {}     # (item_type, id) -> (((item_type, id), score), ...) best first
+        self.built_at = 0.0
+        self._rows: dict = {}          # (item_type, id) -> matrix row
+        self._vocab: dict = {}
+        self._idf = np.zeros(0)
+        self._matrix = sparse.csr_matrix((0, 0))
+        self._lock = Lock()
+
+    # ── reads ──
+    def related(self, key: tuple, limit: int) -> list:
+        """[(card, score), ...] most similar first."""
+        cards = self.cards
+        return [(cards[k], score) for k, score in self.neighbours.get(key, ())[:limit] if k in cards]
+
+    def search(self, query: str, limit: int = 3, item_type: str = None) -> list:
+        """[(card, score, snippet), ...] for free text, best first."""
+        terms = tokenize(query)
+        with self._lock:
+            cols, weights = self._weights(Counter(terms), self._vocab, self._idf)
+            if not len(cols):
+                return []
+            vector = sparse.csr_matrix((weights, cols, [0, len(cols)]), shape=(1, len(self._vocab)))
+            scores = (self._matrix @ vector.T).toarray().ravel()
+            if item_type:
+                scores[[i for i, key in enumerate(self.keys) if key[0] != item_type]] = 0
+            top = self._top(scores, self.keys)[:limit]
+            return [(self.cards[key], score, snippet(self.bodies.get(key, ""), terms))
+                    for key, score in top if key in self.cards]
+
+    def items(self, item_type: str, limit: int) -> list:
+        """Cards of one type, newest (highest id) first."""
+        keys = sorted((k for k in self.cards if k[0] == item_type), key=lambda k: k[1], reverse=True)
+        return [self.cards[k] for k in keys[:limit]]
+
+    def documents(self) -> list:
+        """Everything build() needs, as JSON-friendly lists — for the content snapshot."""
+        with self._lock:
+            return [[key[0], key[1], self.titles.get(key, ""), self.bodies.get(key, ""), card]
+                    for key, card in self.cards.items()]
+
+    # ── full build ──
+    def build(self, docs: list):
+        """Index `docs` = [((item_type, id), title, body, card), ...] from scratch."""
+        counts = [_term_counts(title, body) for _, title, body, _ in docs]
+        df = Counter(term for c in counts for term in c)
+        terms = sorted(df)
+        vocab = {term: i for i, term in enumerate(terms)}
+        n = len(docs)
+        idf = np.log((1 + n) / (1 + np.array([df[t] for t in terms], dtype=float))) + 1
+
+        indptr, indices, data = [0], [], []
+        for c in counts:
+            cols, weights = self._weights(c, vocab, idf)
+            indices.extend(cols)
+            data.extend(weights)
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix((np.array(data, dtype=float), np.array(indices, dtype=np.int64), indptr),
+                                   shape=(n, len(terms)))
+
+        keys = [key for key, _, _, _ in docs]
+        neighbours = {}
+        transposed = matrix.T.tocsc()
+        for start in range(0, n, CHUNK_ROWS):
+            block = (matrix[start:start + CHUNK_ROWS] @ transposed).toarray()
+            for offset, scores in enumerate(block):
+                scores[start + offset] = 0
+                neighbours[keys[start + offset]] = self._top(scores, keys)
+
+        with self._lock:
+            self.keys, self._rows = keys, {key: row for row, key in enumerate(keys)}
+            self._vocab, self._idf, self._matrix = vocab, idf, matrix
+            self.cards = {key: card for key, _, _, card in docs}
+            self.titles = {key: title for key, title, _, _ in docs}
+            self.bodies = {key: body for key, _, body, _ in docs}
+            self.neighbours = neighbours
+            self.built_at = time.time()
+
+    # ── incremental ──
+    def upsert(self, key: tuple, title: str, body: str, card: dict):
+        """Re-index one created or edited item and patch the lists it affects."""
+        with self._lock:
+            if not self.built_at:
+                return   # the first build will pick it up
+            cols, weights = self._weights(_term_counts(title, body), self._vocab, self._idf)
+            vector = sparse.csr_matrix((weights, cols, [0, len(cols)]), shape=(1, len(self._vocab)))
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = len(self.keys)
+                self.keys.append(key)
+                self._matrix = sparse.vstack([self._matrix, vector], format="csr")
+            else:
+                matrix = self._matrix.tolil()
+                matrix[row] = vector
+                self._matrix = matrix.tocsr()
+            self.cards = {**self.cards, key: card}
+            self.titles[key], self.bodies[key] = title, body
+
+            scores = (self._matrix @ vector.T).toarray().ravel()
+            scores[row] = 0
+            listed_before = {k: dict(self.neighbours[k])[key] for k in self._cited_by(self.neighbours, key)}
+            neighbours = dict(self.neighbours)
+            neighbours[key] = self._top(scores, self.keys)
+            for other_key, before in listed_before.items():
+                if scores[self._rows[other_key]] < before:
+                    # It slipped — something outside the list may now outrank it.
+                    neighbours[other_key] = self._row_neighbours(self._rows[other_key])
+            for other in np.flatnonzero(scores > 0).tolist():
+                other_key = self.keys[other]
+                current = neighbours.get(other_key, ())
+                if other_key in listed_before and scores[other] < listed_before[other_key]:
+                    continue
+                if len(current) < self.top_n or scores[other] > current[-1][1] or other_key in listed_before:
+                    merged = dict(current)
+                    merged[key] = round(float(scores[other]), 4)
+                    neighbours[other_key] = tuple(sorted(merged.items(), key=lambda kv: -kv[1])[:self.top_n])
+            self.neighbours = neighbours
+
+    def remove(self, key: tuple):
+        """Forget a deleted item; items that listed it are re-scored."""
+        with self._lock:
+            row = self._rows.get(key)
+            if not self.built_at or row is None:
+                return
+            matrix = self._matrix.tolil()
+            matrix[row] = 0
+            self._matrix = matrix.tocsr()
+            self._matrix.eliminate_zeros()
+            self.cards = {k: v for k, v in self.cards.items() if k != key}
+            self.titles.pop(key, None)
+            self.bodies.pop(key, None)
+            neighbours = {k: v for k, v in self.neighbours.items() if k != key}
+            for other_key in self._cited_by(neighbours, key):
+                neighbours[other_key] = self._row_neighbours(self._rows[other_key])
+            self.neighbours = neighbours
+
+    # ── helpers ──
+    @staticmethod
+    def _weights(counts: Counter, vocab: dict, idf: np.ndarray) -> tuple:
+        cols = np.array([vocab[t] for t in counts if t in vocab], dtype=np.int64)
+        tf = np.array([counts[t] for t in counts if t in vocab], dtype=float)
+        weights = (1 + np.log(tf)) * idf[cols] if len(cols) else np.zeros(0)
+        norm = np.linalg.norm(weights)
+        return cols, (weights / norm if norm else weights)
+
+    def _top(self, scores: np.ndarray, keys: list) -> tuple:
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > self.top_n:
+            candidates = candidates[np.argpartition(-scores[candidates], self.top_n - 1)[:self.top_n]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return tuple((keys[i], round(float(scores[i]), 4)) for i in order.tolist())
+
+    def _row_neighbours(self, row: int) -> tuple:
+        scores = (self._matrix @ self._matrix[row].T).toarray().ravel()
+        scores[row] = 0
+        return self._top(scores, self.keys)
+
+    @staticmethod
+    def _cited_by(neighbours: dict, key: tuple) -> list:
+        return [k for k, listed in neighbours.items() if any(n == key for n, _ in listed)]
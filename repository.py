@@ -0,0 +1,408 @@
+import copy
+import os
+import time
+from datetime import datetime
+from threading import Event, Lock
+
+from sqlalchemy import create_engine, event, func, select, insert, update, delete
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.types import DateTime
+
+from models import Base
+
+# =========================
+# REPOSITORY INTERFACE
+# =========================
+# Endpoints talk to `db.table(name)` and chain the same PostgREST-style
+# builder calls the supabase client exposes:
+#
+#   db.table("comments").select("id, content").eq("item_id", 3)
+#     .order("id", desc=True).range(0, 9).execute().data
+#
+# Two implementations:
+#   SupabaseRepository — the remote supabase client, unchanged behaviour
+#   SQLRepository      — local SQLAlchemy/SQLite built on models.py, for tests,
+#                        benchmarks and single-node deployments
+#
+# Selected with STORAGE_BACKEND=supabase|sqlite (DATABASE_URL for sqlite).
+
+# Upper bound on any single data-access call. The supabase client default is
+# 120s, long enough to exhaust the threadpool during an upstream incident.
+DB_TIMEOUT_SECONDS = float(os.getenv("DB_TIMEOUT_SECONDS", "5"))
+
+
+class Result:
+    """Mirror of the postgrest APIResponse fields endpoints use."""
+
+    def __init__(self, data: list, count: int = None):
+        self.data = data
+        self.count = count
+
+
+class Repository:
+    backend = "abstract"
+
+    def table(self, name: str):
+        raise NotImplementedError
+
+
+class SupabaseRepository(Repository):
+    backend = "supabase"
+
+    def __init__(self, client):
+        self.client = client
+
+    def table(self, name: str):
+        return self.client.table(name)
+
+
+class WrappedRepository(Repository):
+    """
+    Base for repositories that decorate another one. Queries come back as a
+    QueryProxy whose execute() goes through `self.run(table, operation, execute, key)`,
+    where `key` identifies the query (table plus the builder calls made).
+    Other attributes (e.g. the supabase `client`) pass straight through.
+    """
+
+    def __init__(self, inner: Repository):
+        self.inner = inner
+        self.backend = inner.backend
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def table(self, name: str):
+        return QueryProxy(self.inner.table(name), name, "select", self.run, (name,))
+
+    def run(self, table: str, operation: str, execute, key: tuple = None):
+        return execute()
+
+
+class InstrumentedRepository(WrappedRepository):
+    """Reports each execute() to `observe(table, operation, seconds, ok)`."""
+
+    def __init__(self, inner: Repository, observe):
+        super().__init__(inner)
+        self._observe = observe
+
+    def run(self, table: str, operation: str, execute, key: tuple = None):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = execute()
+            ok = True
+            return result
+        finally:
+            self._observe(table, operation, time.perf_counter() - start, ok)
+
+
+_OPERATIONS = {"select", "insert", "update", "upsert", "delete"}
+
+
+class QueryProxy:
+    """Proxy over a query builder that follows the chain, tracking the operation."""
+
+    __slots__ = ("_query", "_table", "_op", "_run", "_key")
+
+    def __init__(self, query, table: str, op: str, run, key: tuple):
+        self._query = query
+        self._table = table
+        self._op = op
+        self._run = run
+        self._key = key
+
+    def __getattr__(self, attr):
+        value = getattr(self._query, attr)
+        if not callable(value):
+            # e.g. postgrest's `.not_` property returns another builder
+            if hasattr(value, "execute"):
+                key = None if self._key is None else self._key + (attr,)
+                return QueryProxy(value, self._table, self._op, self._run, key)
+            return value
+
+        def call(*args, **kwargs):
+            result = value(*args, **kwargs)
+            if not hasattr(result, "execute"):
+                return result
+            op = attr if attr in _OPERATIONS else self._op
+            key = None if self._key is None else self._key + ((attr, repr(args), repr(sorted(kwargs.items()))),)
+            return QueryProxy(result, self._table, op, self._run, key)
+        return call
+
+    def execute(self):
+        return self._run(self._table, self._op, self._query.execute, self._key)
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+def _clone(result):
+    """Per-caller copy of a result so one request can't mutate another's rows."""
+    clone = copy.copy(result)
+    data = getattr(result, "data", None)
+    if isinstance(data, list):
+        clone.data = [dict(row) if isinstance(row, dict) else row for row in data]
+    return clone
+
+
+class CoalescingRepository(WrappedRepository):
+    """
+    Single-flight reads: while a select is in flight, identical selects (same
+    table, same builder calls) wait for it and share its result instead of
+    issuing their own upstream query. Writes always go through. Followers
+    give up waiting after `wait_seconds` and query for themselves.
+
+    A shared read can predate a write that finished while it was in flight,
+    so read-modify-write paths (counter bumps) use table(name, coalesce=False).
+    """
+
+    def __init__(self, inner: Repository, on_shared=None, wait_seconds: float = DB_TIMEOUT_SECONDS * 3):
+        super().__init__(inner)
+        self._flights: dict = {}
+        self._lock = Lock()
+        self._on_shared = on_shared
+        self._wait_seconds = wait_seconds
+
+    def table(self, name: str, coalesce: bool = True):
+        proxy = super().table(name)
+        if not coalesce:
+            proxy._key = None   # no key, no sharing — see run()
+        return proxy
+
+    def run(self, table: str, operation: str, execute, key: tuple = None):
+        if operation != "select" or key is None:
+            return execute()
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if not flight.done.wait(self._wait_seconds):
+                return execute()
+            if self._on_shared:
+                self._on_shared(table)
+            if flight.error is not None:
+                raise flight.error
+            return _clone(flight.result)
+
+        try:
+            result = execute()
+            # Followers copy from a private clone, made before they're woken,
+            # so nothing the leader's caller does to its rows can reach them.
+            flight.result = _clone(result)
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+
+# =========================
+# LOCAL SQLALCHEMY / SQLITE
+# =========================
+def _to_db_value(column, value):
+    """PostgREST takes ISO strings for timestamps; SQLAlchemy wants datetimes."""
+    if isinstance(value, str) and isinstance(column.type, DateTime):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            return value
+    return value
+
+
+def _to_json_row(row) -> dict:
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row._mapping.items()}
+
+
+class SQLQuery:
+    """Builder over one table — accumulates filters, runs on execute()."""
+
+    def __init__(self, repo: "SQLRepository", table):
+        self._repo = repo
+        self._table = table
+        self._op = "select"
+        self._columns = None
+        self._count = None
+        self._payload = None
+        self._filters = []
+        self._order = []
+        self._offset = None
+        self._limit = None
+
+    # ── operations ──
+    def select(self, columns: str = "*", count: str = None):
+        self._op = "select"
+        self._count = count
+        if columns and columns.strip() != "*":
+            self._columns = [self._col(c.strip()) for c in columns.split(",") if c.strip()]
+        return self
+
+    def insert(self, payload):
+        self._op = "insert"
+        self._payload = payload if isinstance(payload, list) else [payload]
+        return self
+
+    def update(self, payload: dict):
+        self._op = "update"
+        self._payload = payload
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    # ── filters ──
+    def eq(self, column, value):
+        col = self._col(column)
+        self._filters.append(col == _to_db_value(col, value))
+        return self
+
+    def neq(self, column, value):
+        col = self._col(column)
+        self._filters.append(col != _to_db_value(col, value))
+        return self
+
+    def gt(self, column, value):
+        col = self._col(column)
+        self._filters.append(col > _to_db_value(col, value))
+        return self
+
+    def gte(self, column, value):
+        col = self._col(column)
+        self._filters.append(col >= _to_db_value(col, value))
+        return self
+
+    def lt(self, column, value):
+        col = self._col(column)
+        self._filters.append(col < _to_db_value(col, value))
+        return self
+
+    def lte(self, column, value):
+        col = self._col(column)
+        self._filters.append(col <= _to_db_value(col, value))
+        return self
+
+    def ilike(self, column, pattern: str):
+        self._filters.append(self._col(column).ilike(pattern))
+        return self
+
+    def in_(self, column, values):
+        self._filters.append(self._col(column).in_(list(values)))
+        return self
+
+    def is_(self, column, value):
+        col = self._col(column)
+        self._filters.append(col.is_(None) if value in (None, "null") else col.is_(value))
+        return self
+
+    # ── modifiers ──
+    def order(self, column, desc: bool = False, **_):
+        col = self._col(column)
+        self._order.append(col.desc() if desc else col.asc())
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def _col(self, name: str):
+        try:
+            return self._table.c[name]
+        except KeyError:
+            raise ValueError(f"column {self._table.name}.{name} does not exist")
+
+    def _clean(self, payload: dict) -> dict:
+        unknown = [k for k in payload if k not in self._table.c]
+        if unknown:
+            raise ValueError(f"column {self._table.name}.{unknown[0]} does not exist")
+        return {k: _to_db_value(self._table.c[k], v) for k, v in payload.items()}
+
+    def execute(self) -> Result:
+        with self._repo.engine.begin() as conn:
+            if self._op == "insert":
+                rows = [self._clean(p) for p in self._payload]
+                stmt = insert(self._table).returning(*self._table.c)
+                return Result([_to_json_row(conn.execute(stmt, row).one()) for row in rows])
+
+            if self._op == "update":
+                stmt = (update(self._table).where(*self._filters)
+                        .values(self._clean(self._payload)).returning(*self._table.c))
+                return Result([_to_json_row(r) for r in conn.execute(stmt)])
+
+            if self._op == "delete":
+                stmt = delete(self._table).where(*self._filters).returning(*self._table.c)
+                return Result([_to_json_row(r) for r in conn.execute(stmt)])
+
+            stmt = select(*(self._columns or self._table.c)).where(*self._filters)
+            count = None
+            if self._count:
+                count = conn.execute(
+                    select(func.count()).select_from(self._table).where(*self._filters)
+                ).scalar()
+            if self._order:
+                stmt = stmt.order_by(*self._order)
+            if self._limit is not None:
+                stmt = stmt.limit(self._limit)
+            if self._offset:
+                stmt = stmt.offset(self._offset)
+            return Result([_to_json_row(r) for r in conn.execute(stmt)], count)
+
+
+class SQLRepository(Repository):
+    backend = "sqlite"
+
+    def __init__(self, url: str = "sqlite:///./quoteme.db"):
+        kwargs = {}
+        if url.startswith("sqlite"):
+            kwargs["connect_args"] = {"check_same_thread": False, "timeout": DB_TIMEOUT_SECONDS}
+            if ":memory:" in url or url == "sqlite://":
+                kwargs["poolclass"] = StaticPool
+        self.engine = create_engine(url, **kwargs)
+        if url.startswith("sqlite"):
+            event.listen(self.engine, "connect", _sqlite_pragmas)
+        Base.metadata.create_all(self.engine)
+        self.tables = Base.metadata.tables
+
+    def table(self, name: str) -> SQLQuery:
+        if name not in self.tables:
+            raise ValueError(f"relation {name} does not exist")
+        return SQLQuery(self, self.tables[name])
+
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")      # readers never block the writer
+    cur.execute("PRAGMA synchronous=NORMAL")    # safe with WAL, far fewer fsyncs
+    cur.execute("PRAGMA foreign_keys=ON")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.close()
+
+
+def create_repository() -> Repository:
+    """Build the repository selected by STORAGE_BACKEND."""
+    backend = os.getenv("STORAGE_BACKEND", "supabase").lower()
+    if backend == "sqlite":
+        return SQLRepository(os.getenv("DATABASE_URL", "sqlite:///./quoteme.db"))
+    if backend != "supabase":
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected supabase or sqlite)")
+    from supabase import ClientOptions, create_client
+    options = ClientOptions(postgrest_client_timeout=DB_TIMEOUT_SECONDS,
+                            storage_client_timeout=max(int(DB_TIMEOUT_SECONDS) * 4, 20))
+    return SupabaseRepository(create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"), options=options))
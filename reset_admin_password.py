@@ -4,6 +4,8 @@ from passlib.hash import bcrypt
 import logging_setup
 import getpass
 
+logging_setup.setup_logging()
+
 db = SessionLocal()
 
 # Ask which admin to reset
@@ -0,0 +1,168 @@
+import logging
+import os
+import random
+import time
+from threading import Lock
+
+from repository import Repository, WrappedRepository
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - only installed with supabase
+    httpx = None
+
+try:
+    from postgrest.exceptions import APIError
+except ImportError:  # pragma: no cover - only installed with supabase
+    APIError = None
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# RESILIENCE SETTINGS
+# =========================
+# Per-call timeouts are enforced by the client itself (postgrest/httpx
+# timeout, SQLite busy timeout — see repository.create_repository); this
+# layer decides what to do when a call fails:
+#
+#  - reads (select) are retried DB_RETRIES times with jittered exponential
+#    backoff; writes are never retried, they may have been applied;
+#  - each table has a circuit breaker. BREAKER_FAILURES consecutive transient
+#    failures open it, and for BREAKER_COOLDOWN seconds calls fail instantly
+#    with CircuitOpenError instead of tying up a worker thread. After that a
+#    single trial call is let through; success closes the breaker.
+#
+# Only transient errors (network, timeouts, 5xx, locked database) count.
+# A bad column or a constraint violation is the caller's problem, not an outage.
+
+DB_RETRIES = int(os.getenv("DB_RETRIES", "2"))
+DB_BACKOFF_BASE = float(os.getenv("DB_BACKOFF_BASE", "0.05"))
+DB_BACKOFF_MAX = float(os.getenv("DB_BACKOFF_MAX", "0.5"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+# PostgREST codes for "couldn't reach / talk to Postgres"; Postgres SQLSTATE
+# classes 08 (connection), 53 (resources), 57 (operator intervention/timeout).
+_TRANSIENT_PGRST = {"PGRST000", "PGRST001", "PGRST002", "PGRST003"}
+_TRANSIENT_SQLSTATE = ("08", "53", "57")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a table whose breaker is open."""
+
+    def __init__(self, table: str, retry_in: float):
+        super().__init__(f"{table} unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.table = table
+        self.retry_in = retry_in
+
+
+def is_transient(e: Exception) -> bool:
+    """True for failures worth retrying / counting against the breaker."""
+    if isinstance(e, CircuitOpenError):
+        return True
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    if httpx is not None and isinstance(e, httpx.TransportError):
+        return True
+    if APIError is not None and isinstance(e, APIError):
+        code = str(e.code or "")
+        if not code:
+            return True   # non-JSON error body, i.e. a proxy/gateway page
+        return (code in _TRANSIENT_PGRST or code.startswith(_TRANSIENT_SQLSTATE)
+                or (len(code) == 3 and code.startswith("5")))
+    # sqlalchemy.exc.OperationalError: "database is locked", disk I/O errors
+    return type(e).__name__ == "OperationalError"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == "open" and elapsed >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            raise CircuitOpenError(self.name, max(self.cooldown - elapsed, 0))
+
+    def on_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"circuit {self.name}: closed")
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def on_failure(self):
+        with self._lock:
+            self._trial_in_flight = False
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failures:
+                if self.state != "open":
+                    logger.warning(f"circuit {self.name}: open after {self.consecutive_failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def on_neutral(self):
+        """The call failed for a non-transient reason — the upstream answered."""
+        self.on_success()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in": round(max(self.cooldown - (time.monotonic() - self.opened_at), 0), 1)
+                            if self.state == "open" else 0,
+            }
+
+
+class ResilientRepository(WrappedRepository):
+    """Retries reads and guards every table with its own CircuitBreaker."""
+
+    def __init__(self, inner: Repository):
+        super().__init__(inner)
+        self.breakers: dict = {}
+        self._breakers_lock = Lock()
+
+    def breaker(self, table: str) -> CircuitBreaker:
+        breaker = self.breakers.get(table)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self.breakers.setdefault(table, CircuitBreaker(table))
+        return breaker
+
+    def run(self, table: str, operation: str, execute, key: tuple = None):
+        breaker = self.breaker(table)
+        attempts = 1 + (DB_RETRIES if operation == "select" else 0)
+        for attempt in range(attempts):
+            breaker.before_call()
+            try:
+                result = execute()
+            except Exception as e:
+                if not is_transient(e):
+                    breaker.on_neutral()
+                    raise
+                breaker.on_failure()
+                if attempt + 1 >= attempts:
+                    raise
+                delay = min(DB_BACKOFF_MAX, DB_BACKOFF_BASE * 2 ** attempt)
+                time.sleep(random.uniform(0, delay))   # full jitter
+                continue
+            breaker.on_success()
+            return result
+
+    def status(self) -> dict:
+        return {table: b.snapshot() for table, b in sorted(self.breakers.items())}
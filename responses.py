@@ -0,0 +1,172 @@
+import gzip
+import json
+import os
+from typing import Any
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, gzip is always available
+    brotli = None
+
+# =========================
+# THRESHOLDS
+# =========================
+# Chosen from benchmarks/bench_compression.py on realistic payloads:
+#  - under ~512 bytes gzip saves <100 bytes, less than it costs in headers/CPU;
+#  - gzip-5 gets within ~1% of gzip-9 at a quarter of the time;
+#  - brotli only beats gzip-5 meaningfully at quality 6 on large bodies
+#    (story/comment lists), so it is reserved for those.
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "512"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_MIN_BYTES = int(os.getenv("BROTLI_MIN_BYTES", "16384"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "6"))
+
+MAX_BUFFER_BYTES = 2 * 1024 * 1024
+
+COMPRESSIBLE_TYPES = {"application/json", "text/html"}
+
+
+# =========================
+# FAST JSON
+# =========================
+def dumps(content: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=str,
+    ).encode("utf-8")
+
+
+class ORJSONResponse(JSONResponse):
+    """Default response class — same wire format as JSONResponse, faster encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# =========================
+# COMPRESSION
+# =========================
+def compress(body: bytes, accept_encoding: str) -> tuple[bytes, str | None]:
+    """
+    Pick an encoding for `body` based on size and the client's Accept-Encoding.
+    Returns (body, encoding) — encoding is None when the body is sent as-is.
+    """
+    size = len(body)
+    accept = accept_encoding.lower()
+    if brotli is not None and "br" in accept and size >= BROTLI_MIN_BYTES:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if "gzip" in accept and size >= GZIP_MIN_BYTES:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
+    return body, None
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses JSON/HTML responses once the full body is
+    known. Other media types (SSE, NDJSON exports, images), already-encoded
+    bodies and bodies over MAX_BUFFER_BYTES pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        if "gzip" not in accept and "br" not in accept:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+        chunks: list[bytes] = []
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+                if (media_type not in COMPRESSIBLE_TYPES or "content-encoding" in headers
+                        or message["status"] == 206):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] == "http.response.body" and start_message is not None:
+                chunks.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    buffered = sum(len(c) for c in chunks)
+                    if buffered > MAX_BUFFER_BYTES:
+                        # Too big to hold in memory — give up and stream as-is.
+                        passthrough = True
+                        await send(start_message)
+                        await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                    return
+
+                body, encoding = compress(b"".join(chunks), accept)
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if encoding:
+                    headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                start_message["headers"] = headers.raw
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# =========================
+# PRE-COMPRESSED DOCUMENTS
+# =========================
+def precompress(body: bytes) -> dict:
+    """
+    Encode a cacheable document once, at higher effort than the per-request
+    middleware can afford. Returns {"identity": ..., "gzip": ..., "br": ...}.
+    """
+    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=9)
+    return variants
+
+
+def precompressed_response(variants: dict, accept_encoding: str,
+                           media_type: str = "application/json", headers: dict = None) -> Response:
+    """Serve the best variant from precompress() for this client."""
+    accept = accept_encoding.lower()
+    encoding = None
+    if "br" in variants and "br" in accept:
+        encoding = "br"
+    elif "gzip" in accept:
+        encoding = "gzip"
+    response = Response(variants[encoding or "identity"], media_type=media_type, headers=headers)
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
@@ -53,6 +53,7 @@ class StoryOut(BaseModel):
     id: int
     title: str
     content: str
+    excerpt: Optional[str] = None
     image_url: Optional[str] = None
     likes: int = 0
     created_at: Optional[datetime] = None
@@ -69,6 +70,7 @@ class BlogOut(BaseModel):
     id: int
     title: str
     content: str
+    excerpt: Optional[str] = None
     image_url: Optional[str] = None
     likes: int = 0
     created_at: Optional[datetime] = None
@@ -0,0 +1,86 @@
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# ON-DISK CONTENT SNAPSHOT
+# =========================
+# Public content is periodically written to one gzip'd JSON file, replaced
+# atomically (temp file + fsync + rename), so a crash mid-write can never
+# leave a torn snapshot behind. At boot it's read back before the first
+# request to pre-warm the caches. That way a fresh deploy serves the homepage
+# at warm latency, and can still serve it if the upstream is unreachable.
+#
+#   SNAPSHOT_PATH      file to write ("./content_snapshot.json.gz"; empty disables)
+#   SNAPSHOT_INTERVAL  seconds between refreshes (300)
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "./content_snapshot.json.gz")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))
+SNAPSHOT_VERSION = 1
+
+
+def save(doc: dict, path: str = SNAPSHOT_PATH):
+    """Atomically replace the snapshot at `path` with `doc`."""
+    body = gzip.compress(dumps({"version": SNAPSHOT_VERSION, "saved_at": time.time(), **doc}),
+                         compresslevel=6, mtime=0)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def load(path: str = SNAPSHOT_PATH) -> dict | None:
+    """The saved snapshot, or None if missing, unreadable or from another version."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            doc = json.loads(gzip.decompress(f.read()))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+    if doc.get("version") != SNAPSHOT_VERSION:
+        return None
+    return doc
+
+
+def start_refresher(refresh, interval: float = SNAPSHOT_INTERVAL, first_delay: float = 2.0):
+    """
+    Call `refresh()` shortly after boot (revalidating whatever was loaded from
+    disk) and then every `interval` seconds, on a daemon thread.
+    """
+    if not SNAPSHOT_PATH or interval <= 0:
+        return None
+
+    def loop():
+        delay = first_delay
+        while True:
+            time.sleep(delay)
+            delay = interval
+            try:
+                refresh()
+            except Exception as e:
+                # Upstream down — keep serving what we have, try again next round.
+                logger.warning(f"Snapshot refresh failed: {e}")
+
+    thread = threading.Thread(target=loop, name="snapshot-refresher", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,149 @@
+import codecs
+import csv
+import io
+import json
+import os
+
+from responses import dumps
+
+# =========================
+# CONTENT IMPORT / EXPORT
+# =========================
+# NDJSON (one JSON object per line) and CSV (header row + one row per item),
+# streamed both ways. Imports are parsed as the request body arrives — a
+# record at a time, never the whole upload — and exports read the table in
+# keyset pages (id > last id seen) and send each page as soon as it's encoded,
+# so a library of any size moves in constant memory.
+#
+#   IMPORT_BATCH_ROWS  rows per insert call (200)
+#   EXPORT_PAGE_ROWS   rows per page read during an export (500)
+
+IMPORT_BATCH_ROWS = int(os.getenv("IMPORT_BATCH_ROWS", "200"))
+EXPORT_PAGE_ROWS = int(os.getenv("EXPORT_PAGE_ROWS", "500"))
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv":    "text/csv; charset=utf-8",
+}
+_CONTENT_TYPES = {"application/x-ndjson": "ndjson", "application/jsonl": "ndjson",
+                  "application/json": "ndjson", "text/csv": "csv"}
+
+
+def format_for(content_type: str | None, requested: str | None) -> str | None:
+    """"ndjson" / "csv" from ?format= or else the Content-Type, None if neither says."""
+    if requested:
+        return requested.lower() if requested.lower() in FORMATS else None
+    media_type = (content_type or "").partition(";")[0].strip().lower()
+    return _CONTENT_TYPES.get(media_type)
+
+
+# ── import ──
+class _Parser:
+    """Turns lines into (line_no, record) pairs; a record is a dict or the ValueError it raised."""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.line_no = 0
+        self.header = None
+        self._pending = []        # CSV lines of a record whose quoted field spans lines
+        self._pending_start = 0
+        self._quotes = 0
+
+    def feed(self, line: str) -> list:
+        self.line_no += 1
+        line = line.rstrip("\r")
+        if self.fmt == "ndjson":
+            return self._ndjson(line)
+        if not self._pending:
+            self._pending_start = self.line_no
+            self._quotes = 0
+        self._pending.append(line)
+        self._quotes += line.count('"')
+        if self._quotes % 2:
+            return []             # inside a quoted field — wait for the closing quote
+        text = "\n".join(self._pending)
+        self._pending = []
+        return self._csv(text)
+
+    def finish(self) -> list:
+        if self._pending:
+            self._pending = []
+            return [(self._pending_start, ValueError("unterminated quoted field"))]
+        return []
+
+    def _ndjson(self, line: str) -> list:
+        if not line.strip():
+            return []
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return [(self.line_no, ValueError(f"invalid JSON: {e}"))]
+        if not isinstance(record, dict):
+            return [(self.line_no, ValueError("each line must be a JSON object"))]
+        return [(self.line_no, record)]
+
+    def _csv(self, text: str) -> list:
+        if not text.strip():
+            return []
+        try:
+            row = next(csv.reader([text]))
+        except csv.Error as e:
+            return [(self._pending_start, ValueError(f"invalid CSV: {e}"))]
+        if self.header is None:
+            self.header = [h.strip() for h in row]
+            return []
+        if len(row) != len(self.header):
+            return [(self._pending_start, ValueError(f"expected {len(self.header)} columns, got {len(row)}"))]
+        # An empty cell means "not given", so optional fields fall back to their defaults.
+        return [(self._pending_start, {k: v for k, v in zip(self.header, row) if v != ""})]
+
+
+async def iter_records(chunks, fmt: str):
+    """Async-iterate (line_no, record) from an async stream of UTF-8 byte chunks."""
+    parser = _Parser(fmt)
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    tail = ""
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            for item in parser.feed(line):
+                yield item
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        for item in parser.feed(tail):
+            yield item
+    for item in parser.finish():
+        yield item
+
+
+# ── export ──
+def _csv_bytes(rows: list, columns: list, header: bool = False) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    if header:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow(["" if row.get(c) is None else row.get(c) for c in columns])
+    return out.getvalue().encode("utf-8")
+
+
+def export_pages(fetch_page, columns: list, fmt: str):
+    """
+    Yield the encoded export one page at a time. `fetch_page(after_id)` returns
+    up to EXPORT_PAGE_ROWS rows with id > after_id, ordered by id.
+    """
+    if fmt == "csv":
+        yield _csv_bytes([], columns, header=True)
+    after_id = 0
+    while True:
+        rows = fetch_page(after_id)
+        if not rows:
+            return
+        if fmt == "csv":
+            yield _csv_bytes(rows, columns)
+        else:
+            yield b"".join(dumps(row) + b"\n" for row in rows)
+        after_id = rows[-1]["id"]
+        if len(rows) < EXPORT_PAGE_ROWS:
+            return
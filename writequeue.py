@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from resilience import is_transient
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# WRITE-BEHIND QUEUE
+# =========================
+# Writes whose result the response doesn't need (contact messages, last_seen
+# stamps) are appended to a local SQLite file and the request returns at
+# once. A background thread sends them upstream every WRITE_QUEUE_INTERVAL
+# seconds: queued inserts into one table go as a single multi-row insert, and
+# repeated updates of the same row are merged while they wait, so a user who
+# logs in five times during an outage costs one update, not five.
+#
+# A transient failure (see resilience.is_transient) leaves the writes queued
+# and retries them with exponential backoff, up to WRITE_QUEUE_BACKOFF_MAX
+# between attempts. If upstream rejects a write outright (bad column,
+# constraint), it's retried on its own so it can't block the rest of its
+# batch. If it still fails it's parked as dead, to be retried with
+# POST /admin/write-queue/retry once the cause is fixed.
+#
+# The file is in WAL mode with synchronous=NORMAL, so an accepted write
+# survives a process crash or restart and is sent by the next flush. Rows
+# being flushed are leased (next_at pushed forward) inside an IMMEDIATE
+# transaction, so two processes sharing the file never send the same write.
+# The file is only opened by start(); until then — a script or test that
+# imports the app without running it — writes go straight through.
+#
+#   WRITE_QUEUE_PATH         queue file ("./write_queue.db"; empty = write through, no queue)
+#   WRITE_QUEUE_INTERVAL     seconds between flushes (1)
+#   WRITE_QUEUE_BATCH        writes sent per flush (200)
+#   WRITE_QUEUE_BACKOFF_MAX  longest wait between retries of a failing write (300)
+
+WRITE_QUEUE_PATH = os.getenv("WRITE_QUEUE_PATH", "./write_queue.db")
+WRITE_QUEUE_INTERVAL = float(os.getenv("WRITE_QUEUE_INTERVAL", "1"))
+WRITE_QUEUE_BATCH = int(os.getenv("WRITE_QUEUE_BATCH", "200"))
+WRITE_QUEUE_BACKOFF_MAX = float(os.getenv("WRITE_QUEUE_BACKOFF_MAX", "300"))
+LEASE_SECONDS = 60
+
+WRITES_ENQUEUED = metrics.Counter(
+    "quoteme_write_queue_enqueued_total", "Writes accepted into the write-behind queue.", ("table",))
+WRITES_FLUSHED = metrics.Counter(
+    "quoteme_write_queue_flushed_total", "Queued writes applied upstream.", ("table",))
+WRITES_FAILED = metrics.Counter(
+    "quoteme_write_queue_failures_total", "Queued writes that failed to apply, by kind (transient/rejected).",
+    ("table", "kind"))
+FLUSH_SECONDS = metrics.Histogram(
+    "quoteme_write_queue_flush_seconds", "Time to send one batch of queued writes upstream.", ("table",))
+
+_SCHEMA = """
+create table if not exists writes (
+    id          integer primary key autoincrement,
+    tbl         text not null,
+    op          text not null,      -- insert | update
+    payload     text not null,      -- JSON row / column values
+    match       text,               -- JSON {column: value} an update applies to
+    merge_key   text,               -- pending updates with the same key are merged
+    enqueued_at real not null,
+    attempts    integer not null default 0,
+    next_at     real not null default 0,
+    last_error  text,
+    dead        integer not null default 0
+);
+create index if not exists ix_writes_due on writes (dead, next_at, id);
+create index if not exists ix_writes_merge on writes (merge_key) where merge_key is not null;
+"""
+
+
+def _merge_key(table: str, match: dict) -> str:
+    return json.dumps([table, sorted(match.items())], default=str)
+
+
+class WriteQueue:
+    def __init__(self, repo, path: str = WRITE_QUEUE_PATH):
+        self.repo = repo
+        self.path = path
+        self.last_flush_at = 0.0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._conn = None
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    # ── enqueue ──
+    def insert(self, table: str, row: dict):
+        """Queue an insert of `row` into `table`."""
+        self._enqueue(table, "insert", row, None, None)
+
+    def update(self, table: str, values: dict, **match):
+        """Queue `update table set values where match`; merges with a pending update of the same row."""
+        self._enqueue(table, "update", values, match, _merge_key(table, match))
+
+    def _enqueue(self, table: str, op: str, payload: dict, match: dict | None, merge_key: str | None):
+        if not self.enabled:
+            self._apply(table, op, [payload], match)
+            return
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    pending = None
+                    if merge_key:
+                        pending = self._conn.execute(
+                            "select id, payload from writes where merge_key = ? and dead = 0",
+                            (merge_key,)).fetchone()
+                    if pending:
+                        merged = {**json.loads(pending[1]), **payload}
+                        self._conn.execute("update writes set payload = ? where id = ?",
+                                           (json.dumps(merged, default=str), pending[0]))
+                    else:
+                        self._conn.execute(
+                            "insert into writes (tbl, op, payload, match, merge_key, enqueued_at) values (?, ?, ?, ?, ?, ?)",
+                            (table, op, json.dumps(payload, default=str),
+                             json.dumps(match, default=str) if match else None, merge_key, time.time()))
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            # Local disk trouble — don't lose the write, send it now instead.
+            logger.warning(f"write queue unavailable ({e}); writing {op} on {table} through")
+            self._apply(table, op, [payload], match)
+            return
+        WRITES_ENQUEUED.inc(table)
+
+    # ── flush ──
+    def _claim(self) -> list:
+        """Lease the next due batch: [(id, table, op, payload, match, attempts), ...]."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "select id, tbl, op, payload, match, attempts from writes "
+                    "where dead = 0 and next_at <= ? order by id limit ?", (now, WRITE_QUEUE_BATCH)).fetchall()
+                if rows:
+                    # Leased rows stop taking merges: a flush has already read their payload.
+                    self._conn.execute(
+                        f"update writes set next_at = ?, merge_key = null where id in ({','.join('?' * len(rows))})",
+                        (now + LEASE_SECONDS, *[r[0] for r in rows]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(r[0], r[1], r[2], json.loads(r[3]), json.loads(r[4]) if r[4] else None, r[5]) for r in rows]
+
+    def _apply(self, table: str, op: str, payloads: list, match: dict | None):
+        if op == "insert":
+            self.repo.table(table).insert(payloads).execute()
+            return
+        query = self.repo.table(table).update(payloads[0])
+        for column, value in match.items():
+            query = query.eq(column, value)
+        query.execute()
+
+    def _done(self, ids: list):
+        with self._lock:
+            self._conn.execute(f"delete from writes where id in ({','.join('?' * len(ids))})", ids)
+
+    def _failed(self, entries: list, error: Exception, dead: bool):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for entry_id, table, op, payload, match, attempts in entries:
+                    attempts += 1
+                    retry_at = now + min(WRITE_QUEUE_INTERVAL * 2 ** attempts, WRITE_QUEUE_BACKOFF_MAX)
+                    self._conn.execute(
+                        "update writes set attempts = ?, next_at = ?, last_error = ?, dead = ? where id = ?",
+                        (attempts, retry_at, str(error)[:500], int(dead), entry_id))
+                    if op == "update" and not dead:
+                        self._rejoin(entry_id, payload, _merge_key(table, match))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _rejoin(self, entry_id: int, payload: dict, merge_key: str):
+        """
+        Make a retried update mergeable again. If a newer update of the same row
+        was queued meanwhile, fold this one into it underneath its values, so
+        the retry can never land after — and undo — the newer write.
+        """
+        newer = self._conn.execute(
+            "select id, payload from writes where merge_key = ? and dead = 0", (merge_key,)).fetchone()
+        if newer is None:
+            self._conn.execute("update writes set merge_key = ? where id = ?", (merge_key, entry_id))
+            return
+        merged = {**payload, **json.loads(newer[1])}
+        self._conn.execute(
+            "update writes set payload = ?, enqueued_at = min(enqueued_at, "
+            "(select enqueued_at from writes where id = ?)) where id = ?",
+            (json.dumps(merged, default=str), entry_id, newer[0]))
+        self._conn.execute("delete from writes where id = ?", (entry_id,))
+
+    def _send(self, table: str, op: str, entries: list):
+        start = time.perf_counter()
+        try:
+            self._apply(table, op, [e[3] for e in entries], entries[0][4])
+        except Exception as e:
+            self.last_error = f"{table}: {e}"
+            if is_transient(e):
+                WRITES_FAILED.inc(table, "transient", amount=len(entries))
+                self._failed(entries, e, dead=False)
+            elif len(entries) > 1:
+                for entry in entries:   # find the write upstream won't take
+                    self._send(table, op, [entry])
+            else:
+                WRITES_FAILED.inc(table, "rejected")
+                logger.error(f"write queue: {op} on {table} rejected, parked as dead: {e}")
+                self._failed(entries, e, dead=True)
+            return
+        self.last_error = None
+        FLUSH_SECONDS.observe(time.perf_counter() - start, table)
+        WRITES_FLUSHED.inc(table, amount=len(entries))
+        self._done([e[0] for e in entries])
+
+    def flush(self) -> int:
+        """Send one batch of due writes upstream. Returns how many were claimed."""
+        if not self.enabled:
+            return 0
+        with self._flush_lock:
+            entries = self._claim()
+            inserts: dict = {}
+            for entry in entries:
+                if entry[2] == "insert":
+                    inserts.setdefault(entry[1], []).append(entry)
+                else:
+                    self._send(entry[1], "update", [entry])
+            for table, group in inserts.items():
+                self._send(table, "insert", group)
+            self.last_flush_at = time.time()
+            return len(entries)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    def start(self):
+        """Open the queue file and flush it every WRITE_QUEUE_INTERVAL seconds on a daemon thread (leftovers from a previous run first)."""
+        if not self.path or self._thread is not None:
+            return self._thread
+        self._open()
+
+        def loop():
+            while True:
+                try:
+                    while self.flush() >= WRITE_QUEUE_BATCH:
+                        pass   # backlog — keep going without waiting
+                except Exception as e:
+                    logger.warning(f"write queue flush failed: {e}")
+                time.sleep(WRITE_QUEUE_INTERVAL)
+
+        self._thread = threading.Thread(target=loop, name="write-queue", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    # ── admin ──
+    def retry_dead(self) -> int:
+        """Put parked writes back in the queue."""
+        if not self.enabled:
+            return 0
+        with self._lock:
+            return self._conn.execute("update writes set dead = 0, attempts = 0, next_at = 0 where dead = 1").rowcount
+
+    def status(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            depth, oldest = self._conn.execute(
+                "select count(*), min(enqueued_at) from writes where dead = 0").fetchone()
+            dead = self._conn.execute("select count(*) from writes where dead = 1").fetchone()[0]
+        return {
+            "enabled": True,
+            "depth": depth,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "dead": dead,
+            "last_flush_at": self.last_flush_at or None,
+            "last_error": self.last_error,
+        }